@@ -1,8 +1,25 @@
 import os
+import json
+import time
+import wave
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import scipy.io.wavfile as wavfile
 import scipy.signal as signal
 import numpy as np
 
+# Number of samples per channel held in memory at a time while filtering
+CHUNK_SIZE = 1 << 20
+
+# Number of files filtered in parallel
+FILTER_WORKERS = os.cpu_count() or 1
+
+# Name of the manifest kept in the output folder: input size/mtime, filter parameters and timing per file
+MANIFEST_NAME = "filter_manifest.json"
+
+# Minimum interval in seconds between manifest writes during a batch
+MANIFEST_SAVE_INTERVAL = 5
+
 # Define the high-pass filter to remove background noise
 def butter_highpass(cutoff, fs, order=5):
     nyquist = 0.5 * fs
@@ -10,41 +27,183 @@ def butter_highpass(cutoff, fs, order=5):
     b, a = signal.butter(order, normal_cutoff, btype='high', analog=False)
     return b, a
 
-def apply_highpass_filter(audio_path, output_path, cutoff=300, order=5):
-    # Load the audio file
-    sample_rate, audio_data = wavfile.read(audio_path)
+# Same filter as second-order sections, which stay numerically stable in float32
+def butter_highpass_sos(cutoff, fs, order=5):
+    nyquist = 0.5 * fs
+    normal_cutoff = cutoff / nyquist
+    return signal.butter(order, normal_cutoff, btype='high', analog=False, output='sos')
+
+# Default edge padding length of scipy.signal.sosfiltfilt
+def sosfiltfilt_padlen(sos):
+    n_sections = sos.shape[0]
+    return 3 * (2 * n_sections + 1 - min((sos[:, 2] == 0).sum(), (sos[:, 5] == 0).sum()))
+
+def iter_chunks(start, stop, chunk_size, reverse=False):
+    bounds = [(s, min(s + chunk_size, stop)) for s in range(start, stop, chunk_size)]
+    return reversed(bounds) if reverse else iter(bounds)
+
+def chunked_sosfiltfilt(sos, x, chunk_size=CHUNK_SIZE, scale=1.0, dtype=np.float32):
+    """Zero-phase filter x of shape (samples, channels) along the time axis, one chunk at a time.
+
+    Matches scipy.signal.sosfiltfilt(sos, x * scale, axis=0) with its default odd
+    extension at both ends: the forward pass carries the filter state across chunks
+    into a temporary memmap, and the backward pass runs over it in reverse, in place.
+    x may itself be a memmap, so neither the input nor the output is held in memory.
+    Returns a memmap view of shape x.shape.
+    """
+    n_samples, n_channels = x.shape
+    sos = np.asarray(sos, dtype=dtype)
+    scale = dtype(scale)
+    if n_samples == 0:
+        return np.zeros((0, n_channels), dtype=dtype)
+    edge = min(sosfiltfilt_padlen(sos), n_samples - 1)
+    buffer = np.memmap(tempfile.TemporaryFile(), dtype=dtype, mode='w+', shape=(n_samples + 2 * edge, n_channels))
+
+    def read(start, stop):
+        return np.asarray(x[start:stop], dtype=dtype) * scale
+
+    zi_unit = signal.sosfilt_zi(sos).astype(dtype)[:, :, np.newaxis]  # (sections, 2, 1)
+
+    # Forward pass over the odd extension: head pad, signal, tail pad
+    first, last = read(0, 1), read(n_samples - 1, n_samples)
+    head = 2 * first - read(1, edge + 1)[::-1]
+    tail = 2 * last - read(n_samples - edge - 1, n_samples - 1)[::-1]
+    zi = zi_unit * (head[:1] if edge else first)
+    if edge:
+        buffer[:edge], zi = signal.sosfilt(sos, head, axis=0, zi=zi)
+    for start, stop in iter_chunks(0, n_samples, chunk_size):
+        buffer[edge + start:edge + stop], zi = signal.sosfilt(sos, read(start, stop), axis=0, zi=zi)
+    if edge:
+        buffer[edge + n_samples:], zi = signal.sosfilt(sos, tail, axis=0, zi=zi)
+
+    # Backward pass, starting from the steady state of the last forward output
+    zi = zi_unit * np.asarray(buffer[-1:])
+    for start, stop in iter_chunks(0, len(buffer), chunk_size, reverse=True):
+        filtered, zi = signal.sosfilt(sos, np.asarray(buffer[start:stop])[::-1], axis=0, zi=zi)
+        buffer[start:stop] = filtered[::-1]
+
+    return buffer[edge:edge + n_samples]
+
+def peak_amplitude(audio_data, chunk_size=CHUNK_SIZE):
+    peak = 0
+    for start, stop in iter_chunks(0, len(audio_data), chunk_size):
+        peak = max(peak, int(np.max(np.abs(np.asarray(audio_data[start:stop], dtype=np.int64)), initial=0)))
+    return peak
+
+def apply_highpass_filter(audio_path, output_path, cutoff=300, order=5, chunk_size=CHUNK_SIZE):
+    # Map the audio file instead of loading it
+    sample_rate, audio_data = wavfile.read(audio_path, mmap=True)
+    if audio_data.ndim == 1:
+        audio_data = audio_data[:, np.newaxis]
 
     # Normalize the audio data if it's in int format
+    scale = 1.0
     if audio_data.dtype != np.float32 and audio_data.dtype != np.float64:
-        audio_data = audio_data / np.max(np.abs(audio_data))
+        peak = peak_amplitude(audio_data, chunk_size)
+        scale = 1.0 / peak if peak else 1.0
+
+    # Apply the high-pass filter to each channel along time
+    sos = butter_highpass_sos(cutoff, sample_rate, order)
+    filtered_audio = chunked_sosfiltfilt(sos, audio_data, chunk_size, scale)
+
+    # Avoid clipping and save the filtered audio chunk by chunk
+    with wave.open(output_path, 'wb') as output_file:
+        output_file.setnchannels(audio_data.shape[1])
+        output_file.setsampwidth(2)
+        output_file.setframerate(sample_rate)
+        for start, stop in iter_chunks(0, len(filtered_audio), chunk_size):
+            chunk = np.clip(filtered_audio[start:stop], -1, 1)
+            output_file.writeframes((chunk * 32767).astype(np.int16).tobytes())
 
-    # Apply the high-pass filter
-    b, a = butter_highpass(cutoff, sample_rate, order)
-    filtered_audio = signal.filtfilt(b, a, audio_data)
+def file_signature(file_path):
+    stat = os.stat(file_path)
+    return [stat.st_size, stat.st_mtime_ns]
 
-    # Avoid clipping
-    filtered_audio = np.clip(filtered_audio, -1, 1)
+def load_manifest(manifest_path):
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Could not read {manifest_path}, filtering everything again: {e}")
+        return {}
 
-    # Save the filtered audio to a new file
-    wavfile.write(output_path, sample_rate, (filtered_audio * 32767).astype(np.int16))
+def save_manifest(manifest_path, manifest):
+    # Write atomically so an interrupted batch keeps the files finished so far
+    with open(manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(manifest_path + '.tmp', manifest_path)
 
-def batch_process(input_folder, output_folder, cutoff=300, order=5):
+def is_up_to_date(entry, input_path, output_path, cutoff, order):
+    return (entry is not None and os.path.exists(output_path)
+            and entry['input'] == file_signature(input_path)
+            and entry['cutoff'] == cutoff and entry['order'] == order)
+
+def filter_file(input_path, output_path, cutoff, order):
+    # Runs in a worker process; returns the wall time spent on this file
+    start = time.perf_counter()
+    apply_highpass_filter(input_path, output_path, cutoff, order)
+    return time.perf_counter() - start
+
+def batch_process(input_folder, output_folder, cutoff=300, order=5, max_workers=FILTER_WORKERS):
     # Ensure the output folder exists
     os.makedirs(output_folder, exist_ok=True)
-    
-    # Iterate over all .wav files in the input folder
-    for filename in os.listdir(input_folder):
-        if filename.endswith(".wav"):
-            input_path = os.path.join(input_folder, filename)
-            output_path = os.path.join(output_folder, filename)
-            
-            print(f"Processing {filename}...")
+    manifest_path = os.path.join(output_folder, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
 
-            # Apply high-pass filter to each file
-            apply_highpass_filter(input_path, output_path, cutoff, order)
+    # Only .wav files whose input or filter parameters changed since the last run are filtered again
+    filenames = sorted(f for f in os.listdir(input_folder) if f.endswith(".wav"))
+    pending = []
+    for filename in filenames:
+        input_path = os.path.join(input_folder, filename)
+        output_path = os.path.join(output_folder, filename)
+        if not is_up_to_date(manifest.get(filename), input_path, output_path, cutoff, order):
+            pending.append(filename)
+
+    # Drop outputs whose input no longer exists
+    for filename in set(manifest) - set(filenames):
+        output_path = os.path.join(output_folder, filename)
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        del manifest[filename]
+    print(f"{len(filenames)} files, {len(filenames) - len(pending)} up to date, {len(pending)} to filter")
+
+    batch_start = time.perf_counter()
+    last_save = batch_start
+    failed = 0
+    with ProcessPoolExecutor(max_workers=max(max_workers, 1)) as executor:
+        futures = {}
+        for filename in pending:
+            input_path = os.path.join(input_folder, filename)
+            # Record the signature taken before filtering, so a file rewritten meanwhile is filtered again next time
+            futures[executor.submit(filter_file, input_path, os.path.join(output_folder, filename), cutoff, order)] = \
+                (filename, file_signature(input_path))
+            manifest.pop(filename, None)
+        for done, future in enumerate(as_completed(futures), 1):
+            filename, signature = futures[future]
+            try:
+                elapsed = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"[{done}/{len(pending)}] Failed {filename}: {e}")
+                continue
+            manifest[filename] = {'input': signature, 'cutoff': cutoff, 'order': order, 'seconds': round(elapsed, 4)}
+            print(f"[{done}/{len(pending)}] Processed {filename} in {elapsed:.2f}s")
+            if time.perf_counter() - last_save > MANIFEST_SAVE_INTERVAL:
+                save_manifest(manifest_path, manifest)
+                last_save = time.perf_counter()
+    save_manifest(manifest_path, manifest)
+    print(f"Filtered {len(pending) - failed} files, {failed} failed, in {time.perf_counter() - batch_start:.1f}s")
 
-# Batch process all .wav files
-input_folder = "./dataset/raw_audio"
-output_folder = "./dataset/pure_audio"
-batch_process(input_folder, output_folder)
+if __name__ == "__main__":
+    # Batch process all .wav files
+    input_folder = "./dataset/raw_audio"
+    output_folder = "./dataset/pure_audio"
+    batch_process(input_folder, output_folder)
 
+    # Full-episode tracks written by extract_wav, filtered once each for episode-level spectrograms
+    episode_input_folder = "./dataset/episode_audio"
+    episode_output_folder = "./dataset/pure_episode_audio"
+    if os.path.isdir(episode_input_folder):
+        batch_process(episode_input_folder, episode_output_folder)
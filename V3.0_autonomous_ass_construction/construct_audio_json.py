@@ -4,6 +4,8 @@ import subprocess
 import sys
 import re
 
+from utils import fill_characters
+
 # 文件路径
 folder_path = "./"  # 当前工作目录
 last_path = "../"  # 上一个目录
@@ -11,6 +13,9 @@ dataset_folder = os.path.join(folder_path, "dataset")
 audio_folder = os.path.join(dataset_folder, "pure_audio")
 video_folder = os.path.join(last_path, "Video_file_set")  # 存放 .flv 文件的文件夹
 title_folder = os.path.join(folder_path, "ass_file_set")  # 存放 .ass 文件的文件夹
+spectrogram_folder = os.path.join(dataset_folder, "spectrograms")  # 用于填写 character 的梅尔频谱
+spectrogram_store_folder = os.path.join(dataset_folder, "spectrogram_store")
+character_model_path = os.path.join(dataset_folder, "character_model.npz")  # kmeans.py 导出的最近质心模型
 json_output = os.path.join(dataset_folder, "audio.json")
 
 # 修改默认编码为 UTF-8
@@ -82,6 +87,7 @@ def generate_json():
     clear_json_file(json_output)
     
     data = []
+    keys = []  # 每个 JSON 项对应的频谱键，用于填写 character
     total_duration = 0  # 累加视频总时长
     base_time = 0  # 累加时间戳
     
@@ -121,6 +127,7 @@ def generate_json():
 
             # 对每条字幕生成对应的 JSON 项
             for j, (start_time, end_time, text_original) in enumerate(mapped_subtitles):
+                keys.append(f"{prefix}_{j+1:03d}")
                 audio_filename = os.path.join(audio_folder, f"{prefix}_{j+1:03d}.wav")
 
                 if os.path.exists(audio_filename):
@@ -149,6 +156,12 @@ def generate_json():
         else:
             print(f"警告: 未找到与 {prefix} 匹配的 .ass 文件，跳过该文件。")
 
+    # 有聚类模型时，直接按最近质心填写 character
+    labelled = fill_characters(data, keys, character_model_path,
+                               spectrogram_folder, spectrogram_store_folder)
+    if labelled:
+        print(f"已为 {labelled} 条字幕填写 character。")
+
     # 保存生成的 JSON 文件
     with open(json_output, 'w', encoding='utf-8') as json_file:
         json.dump(data, json_file, ensure_ascii=False, indent=4)
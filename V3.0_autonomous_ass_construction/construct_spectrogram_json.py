@@ -4,6 +4,8 @@ import subprocess
 import sys
 import re
 
+from utils import SpectrogramStore, fill_characters
+
 # 文件路径
 folder_path = "./"  # 当前工作目录
 last_path = "../"  # 上一个目录
@@ -11,6 +13,8 @@ dataset_folder = os.path.join(folder_path, "dataset")
 audio_folder = os.path.join(dataset_folder, "spectrograms")  # 梅尔频谱图的 .npy 文件
 video_folder = os.path.join(last_path, "Video_file_set")  # 存放 .flv 文件的文件夹
 title_folder = os.path.join(folder_path, "ass_file_set")  # 存放 .ass 文件的文件夹
+spectrogram_store_folder = os.path.join(dataset_folder, "spectrogram_store")  # 打包存储（melspectrogram.py 开启 SPECTROGRAM_STORE_ENABLED 时生成）
+character_model_path = os.path.join(dataset_folder, "character_model.npz")  # kmeans.py 导出的最近质心模型
 json_output = os.path.join(dataset_folder, "spectrograms.json")
 
 # 修改默认编码为 UTF-8
@@ -82,6 +86,7 @@ def generate_json():
     clear_json_file(json_output)
     
     data = []
+    keys = []  # 每个 JSON 项对应的频谱键，用于填写 character
     total_duration = 0  # 累加视频总时长
     base_time = 0  # 累加时间戳
     
@@ -93,6 +98,9 @@ def generate_json():
     video_prefix_map = {os.path.splitext(f)[0]: f for f in video_files}
     title_prefix_map = {os.path.splitext(f)[0]: f for f in title_files}
 
+    # 存在打包存储时，频谱以 spectrogram_ref（数据文件 + 偏移 + 形状）引用，audio_file 留空
+    store = SpectrogramStore(spectrogram_store_folder) if os.path.isdir(spectrogram_store_folder) else None
+
     # 计算所有视频的总时长
     for flv_file in video_files:
         flv_file_path = os.path.join(video_folder, flv_file)
@@ -121,6 +129,34 @@ def generate_json():
 
             # 对每条字幕生成对应的 JSON 项
             for j, (start_time, end_time, text_original) in enumerate(mapped_subtitles):
+                keys.append(f"{prefix}_{j+1:03d}")
+                if store is not None:
+                    key = f"{prefix}_{j+1:03d}"
+                    if (prefix, key) in store:
+                        data.append({
+                            "audio_file": "",
+                            "spectrogram_ref": store.reference(prefix, key),
+                            "text_original": text_original,
+                            "text_processed": "",
+                            "start_time": start_time,
+                            "end_time": end_time,
+                            "character": "",
+                            "emotion_category": ""
+                        })
+                    else:
+                        data.append({
+                            "audio_file": "",
+                            "spectrogram_ref": "",
+                            "text_original": text_original,
+                            "text_processed": "",
+                            "start_time": start_time,
+                            "end_time": end_time,
+                            "character": "",
+                            "emotion_category": ""
+                        })
+                        print(f"警告: 打包存储中未找到 {key}，生成对应的 JSON 项但 spectrogram_ref 为空。")
+                    continue
+
                 audio_filename = os.path.join(audio_folder, f"{prefix}_{j+1:03d}.npy")  # 修改为 .npy 文件
 
                 if os.path.exists(audio_filename):
@@ -149,6 +185,12 @@ def generate_json():
         else:
             print(f"警告: 未找到与 {prefix} 匹配的 .ass 文件，跳过该文件。")
 
+    # 有聚类模型时，直接按最近质心填写 character
+    labelled = fill_characters(data, keys, character_model_path,
+                               audio_folder, spectrogram_store_folder)
+    if labelled:
+        print(f"已为 {labelled} 条字幕填写 character。")
+
     # 保存生成的 JSON 文件
     with open(json_output, 'w', encoding='utf-8') as json_file:
         json.dump(data, json_file, ensure_ascii=False, indent=4)
@@ -1,6 +1,12 @@
 import os
 import subprocess
 import sys
+import json
+import re
+import time
+import wave
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # 修改默认编码为 UTF-8
 sys.stdout.reconfigure(encoding='utf-8')
@@ -12,16 +18,34 @@ dataset_folder = os.path.join(folder_path, "dataset")
 audio_folder = os.path.join(dataset_folder, "raw_audio")
 video_folder = os.path.join(last_path, "Video_file_set")  # 存放 .flv 文件的文件夹
 title_folder = os.path.join(folder_path, "ass_file_set")  # 存放 .ass 文件的文件夹
+episode_audio_folder = os.path.join(dataset_folder, "episode_audio")  # 整集音轨及其字幕时间
+
+# 提取模式：
+# 'single_decode' —— 每集只启动一次 ffmpeg，把整条音轨解码为 PCM 读入内存，再按字幕时间切片写出
+# 'per_segment' —— 每条字幕启动一次 ffmpeg（原始做法，-ss 在 -i 之后，每次都从头解码到起点，用于对比）
+EXTRACT_MODE = 'single_decode'
+
+# 同时提取的集数（single_decode 模式下每集在内存中保留整条音轨的 PCM，约 250MB/24分钟双声道）
+EXTRACT_WORKERS = 4
+
+# 增量提取清单：记录每集 .flv/.ass 的大小与修改时间及片段数，未变化的集不再重新提取
+manifest_path = os.path.join(audio_folder, "extract_manifest.json")
+
+# 同时保存整集音轨（<集名>.wav）和每条字幕的起止秒数（<集名>.segments.json，顺序与片段编号一致），
+# 供 melspectrogram.py 的整集模式（EPISODE_MEL_ENABLED）计算一次梅尔频谱后按时间切片
+SAVE_EPISODE_AUDIO = False
 
 # 创建必要的文件夹
 os.makedirs(audio_folder, exist_ok=True)
+if SAVE_EPISODE_AUDIO:
+    os.makedirs(episode_audio_folder, exist_ok=True)
 
-# 清理音频文件夹中所有的 WAV 文件
+# 清理音频文件夹中所有的 WAV 文件（连同增量提取清单，下次运行全部重新提取）
 def clear_audio_folder(audio_folder):
     for filename in os.listdir(audio_folder):
         file_path = os.path.join(audio_folder, filename)
         try:
-            if filename.endswith(".wav"):
+            if filename.endswith(".wav") or filename == os.path.basename(manifest_path):
                 os.remove(file_path)
                 print(f"已删除: {file_path}")
         except Exception as e:
@@ -68,27 +92,224 @@ def extract_audio_segment(flv_file, start_time, end_time, output_file):
     ]
     subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
 
-# 处理所有视频和对应的ass文件
-def process_videos():
-    # 遍历 Video_file_set 和 Title_file_set 文件夹中的文件
-    video_files = sorted(os.listdir(video_folder))  # 获取所有 .flv 文件
-    title_files = sorted(os.listdir(title_folder))  # 获取所有 .ass 文件
+# 读取第一条音轨的采样率和声道数
+def probe_audio_format(flv_file):
+    command = [
+        "ffprobe", "-v", "error", "-select_streams", "a:0",
+        "-show_entries", "stream=sample_rate,channels", "-of", "json", flv_file
+    ]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True)
+    stream = json.loads(result.stdout)['streams'][0]
+    return int(stream['sample_rate']), int(stream['channels'])
+
+# 一次性把整条音轨解码为 16 位 PCM（与 ffmpeg 默认输出 .wav 的编码、采样率和声道数一致）
+# aresample 按时间戳补齐开头和中途缺失的采样，使 PCM 中的采样序号与字幕时间一一对应
+def decode_audio_track(flv_file):
+    sample_rate, channels = probe_audio_format(flv_file)
+    command = [
+        "ffmpeg", "-v", "error", "-i", flv_file, "-map", "0:a:0", "-af", "aresample=async=1:first_pts=0",
+        "-f", "s16le", "-acodec", "pcm_s16le", "-ar", str(sample_rate), "-ac", str(channels), "pipe:1"
+    ]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True)
+    return result.stdout, sample_rate, channels
+
+# 把 16 位 PCM 数据写成 .wav
+def write_pcm(pcm, sample_rate, channels, output_file):
+    with wave.open(output_file, 'wb') as wav_file:
+        wav_file.setnchannels(channels)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(pcm)
+
+# 从内存中的 PCM 数据切出一段写成 .wav
+def write_pcm_segment(pcm, sample_rate, channels, start_time, end_time, output_file):
+    frame_bytes = 2 * channels
+    start_frame = round(convert_time_to_seconds(start_time) * sample_rate)
+    end_frame = round(convert_time_to_seconds(end_time) * sample_rate)
+    write_pcm(pcm[start_frame * frame_bytes:max(end_frame, start_frame) * frame_bytes], sample_rate, channels, output_file)
+
+# 整集音轨与字幕时间的文件路径
+def episode_audio_paths(episode_name):
+    return (os.path.join(episode_audio_folder, f"{episode_name}.wav"),
+            os.path.join(episode_audio_folder, f"{episode_name}.segments.json"))
+
+# 保存整集音轨和每条字幕的起止秒数；pcm 为 None 时（per_segment 模式）由 ffmpeg 单独解码一次
+def save_episode_audio(episode_name, flv_file, subtitles, pcm=None, sample_rate=None, channels=None):
+    wav_path, segments_path = episode_audio_paths(episode_name)
+    if pcm is None:
+        command = ["ffmpeg", "-y", "-i", flv_file, "-map", "0:a:0", "-af", "aresample=async=1:first_pts=0",
+                   "-acodec", "pcm_s16le", wav_path]
+        subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    else:
+        write_pcm(pcm, sample_rate, channels, wav_path)
+    segments = [[convert_time_to_seconds(start_time), convert_time_to_seconds(end_time)]
+                for start_time, end_time in subtitles]
+    with open(segments_path, 'w', encoding='utf-8') as f:
+        json.dump({'episode': episode_name, 'segments': segments}, f)
+
+# 提取一集的全部字幕对应的音频片段，返回片段数
+def extract_episode(flv_file_path, ass_file_path, mode=None):
+    mode = mode or EXTRACT_MODE
+    subtitles = parse_ass_file(ass_file_path)
+    episode_name = os.path.splitext(os.path.basename(flv_file_path))[0]
+
+    if mode == 'single_decode':
+        pcm, sample_rate, channels = decode_audio_track(flv_file_path)
+    elif mode != 'per_segment':
+        raise ValueError(f"未知的提取模式: {mode}")
+    else:
+        pcm = sample_rate = channels = None
 
-    for flv_file, ass_file in zip(video_files, title_files):
+    if SAVE_EPISODE_AUDIO:
+        save_episode_audio(episode_name, flv_file_path, subtitles, pcm, sample_rate, channels)
+
+    for j, (start_time, end_time) in enumerate(subtitles):
+        audio_filename = os.path.join(audio_folder, f"{episode_name}_{j+1:03d}.wav")
+        if mode == 'single_decode':
+            write_pcm_segment(pcm, sample_rate, channels, start_time, end_time, audio_filename)
+        else:
+            extract_audio_segment(flv_file_path, start_time, end_time, audio_filename)
+        print(f"提取了音频: {audio_filename}")
+    return len(subtitles)
+
+# 在同一集上分别用两种模式提取，对比耗时（后运行的模式覆盖先写出的同名文件）
+def benchmark_extract_modes(flv_file_path, ass_file_path, modes=('per_segment', 'single_decode')):
+    for mode in modes:
+        start = time.perf_counter()
+        count = extract_episode(flv_file_path, ass_file_path, mode)
+        print(f"提取模式: {mode}, 片段数: {count}, 耗时: {time.perf_counter() - start:.1f}s")
+
+# 按文件名对 .flv 和 .ass 配对：优先同名，其次 .ass 文件名以视频文件名开头；返回配对列表和未配对的文件
+def pair_episode_files(video_files, title_files):
+    ass_stems = {os.path.splitext(f)[0]: f for f in title_files if f.endswith('.ass')}
+    pairs, unmatched_videos = [], []
+    # 文件名不完全相同时，接受以视频名开头、且紧跟的不是数字的字幕（ep1 不会配到 ep10.ass），
+    # 有多个候选时视为不确定，不配对；较长的视频名先配对，避免 ep1 抢走 ep1_part2 的字幕
+    for flv_file in sorted((f for f in video_files if f.endswith('.flv')), key=len, reverse=True):
+        stem = os.path.splitext(flv_file)[0]
+        ass_file = ass_stems.pop(stem, None)
+        if ass_file is None:
+            prefixed = sorted(s for s in ass_stems if s.startswith(stem) and not s[len(stem)].isdigit())
+            if len(prefixed) == 1:
+                ass_file = ass_stems.pop(prefixed[0])
+            elif prefixed:
+                print(f"{flv_file} 对应多个字幕文件，无法确定: {', '.join(ass_stems[s] for s in prefixed)}")
+        if ass_file is None:
+            unmatched_videos.append(flv_file)
+        else:
+            pairs.append((flv_file, ass_file))
+    return pairs, unmatched_videos, sorted(ass_stems.values())
+
+# 文件的大小与修改时间
+def file_signature(file_path):
+    stat = os.stat(file_path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def load_manifest():
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"提取清单读取失败，将全部重新提取: {manifest_path}, 错误: {e}")
+        return {}
+
+# 原子地写入清单，中途中断时已完成的集不会丢失
+def save_manifest(manifest):
+    with open(manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+# 某一集已经写出的全部片段文件
+def episode_audio_files(episode_name):
+    pattern = re.compile(rf'{re.escape(episode_name)}_\d{{3,}}\.wav')
+    return [f for f in os.listdir(audio_folder) if pattern.fullmatch(f)]
+
+# 删除某一集的旧片段和整集音轨，重新提取后字幕条数可能变少
+def remove_episode_audio(episode_name):
+    for filename in episode_audio_files(episode_name):
+        os.remove(os.path.join(audio_folder, filename))
+    for file_path in episode_audio_paths(episode_name):
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+# 清单记录与源文件一致，且片段文件齐全
+def is_episode_up_to_date(entry, flv_file_path, ass_file_path, episode_name):
+    if not entry or entry['flv'] != file_signature(flv_file_path) or entry['ass'] != file_signature(ass_file_path):
+        return False
+    if SAVE_EPISODE_AUDIO and not all(os.path.exists(p) for p in episode_audio_paths(episode_name)):
+        return False
+    return len(episode_audio_files(episode_name)) >= entry['count']
+
+# 处理所有视频和对应的ass文件：按文件名配对，多集并行提取，只重新提取源文件有变化的集
+def process_videos(max_workers=EXTRACT_WORKERS):
+    # 通过正则表达式从文件名中提取数字，并使用自然顺序进行排序
+    def natural_sort_key(filename):
+        return [int(text) if text.isdigit() else text for text in re.split(r'(\d+)', filename)]
+
+    pairs, unmatched_videos, unmatched_titles = pair_episode_files(os.listdir(video_folder), os.listdir(title_folder))
+    pairs.sort(key=lambda pair: natural_sort_key(pair[0]))
+    for flv_file in unmatched_videos:
+        print(f"未找到对应的 .ass 文件，跳过: {flv_file}")
+    for ass_file in unmatched_titles:
+        print(f"未找到对应的 .flv 文件，跳过: {ass_file}")
+
+    manifest = load_manifest()
+    manifest_lock = threading.Lock()
+
+    # 源文件已不存在的集，删除其旧片段
+    current_episodes = {os.path.splitext(flv_file)[0] for flv_file, _ in pairs}
+    for episode_name in [name for name in manifest if name not in current_episodes]:
+        remove_episode_audio(episode_name)
+        del manifest[episode_name]
+        print(f"已删除过期音频: {episode_name}")
+
+    pending = []
+    for flv_file, ass_file in pairs:
+        episode_name = os.path.splitext(flv_file)[0]
         flv_file_path = os.path.join(video_folder, flv_file)
         ass_file_path = os.path.join(title_folder, ass_file)
-        
-        # 确保 .flv 和 .ass 文件匹配
-        if flv_file.endswith('.flv') and ass_file.endswith('.ass'):
-            subtitles = parse_ass_file(ass_file_path)
-            for j, (start_time, end_time) in enumerate(subtitles):
-                audio_filename = os.path.join(audio_folder, f"{flv_file[:-4]}_{j+1:03d}.wav")
-                extract_audio_segment(flv_file_path, start_time, end_time, audio_filename)
-                print(f"提取了音频: {audio_filename}")
+        if is_episode_up_to_date(manifest.get(episode_name), flv_file_path, ass_file_path, episode_name):
+            print(f"未变化，跳过: {flv_file}")
+        else:
+            pending.append((episode_name, flv_file_path, ass_file_path))
+    save_manifest(manifest)
+
+    def process_one(episode_name, flv_file_path, ass_file_path):
+        start = time.perf_counter()
+        with manifest_lock:
+            manifest.pop(episode_name, None)
+            save_manifest(manifest)
+        remove_episode_audio(episode_name)
+        count = extract_episode(flv_file_path, ass_file_path)
+        with manifest_lock:
+            manifest[episode_name] = {
+                'flv': file_signature(flv_file_path),
+                'ass': file_signature(ass_file_path),
+                'count': count,
+            }
+            save_manifest(manifest)
+        return count, time.perf_counter() - start
+
+    # 单集失败不影响其他集
+    total_start = time.perf_counter()
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as executor:
+        futures = {executor.submit(process_one, *episode): episode[0] for episode in pending}
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                count, elapsed = future.result()
+                print(f"[{done}/{len(pending)}] {futures[future]}: 提取模式 {EXTRACT_MODE}, 片段数 {count}, 耗时 {elapsed:.1f}s")
+            except Exception as e:
+                failed += 1
+                print(f"[{done}/{len(pending)}] 提取失败: {futures[future]}, 错误: {e}")
+    print(f"共 {len(pairs)} 集, 重新提取 {len(pending)} 集, 失败 {failed} 集, 总耗时 {time.perf_counter() - total_start:.1f}s")
 
 if __name__ == "__main__":
-    # 开始前清理旧的 .wav 文件
-    clear_audio_folder(audio_folder)
+    # 传入 --clean 时先清理全部旧的 .wav 文件，否则只重新提取有变化的集
+    if "--clean" in sys.argv:
+        clear_audio_folder(audio_folder)
     
     # 处理视频和字幕文件
     process_videos()
\ No newline at end of file
@@ -1,26 +1,168 @@
 import os
+import sys
 import json
+import copy
+import time
+import hashlib
+import numpy as np
 import pysubs2
 import torch
 from transformers import RobertaTokenizer, RobertaForSequenceClassification
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import DiskLRUCache
+
+def physical_core_count():
+    """物理核数（同一核上的超线程只算一次）；读不到 /proc/cpuinfo 时退回逻辑核数"""
+    cores, physical_id = set(), None
+    try:
+        with open('/proc/cpuinfo', 'r', encoding='utf-8') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key.strip() == 'physical id':
+                    physical_id = value.strip()
+                elif key.strip() == 'core id':
+                    cores.add((physical_id, value.strip()))
+    except OSError:
+        pass
+    return len(cores) or os.cpu_count() or 1
+
+# 推理方式：'fp32' —— 原始精度，有 GPU 时在 GPU 上运行；
+# 'int8' —— 对全部线性层做动态 int8 量化，只在 CPU 上运行，适合没有 GPU 的标注节点
+INFERENCE_MODE = 'fp32'
+# CPU 线程数（CPU 推理与 fp32/int8 对比时生效）：算子内并行取物理核数；批量推理时算子间并行收益很小
+INTRA_OP_THREADS = physical_core_count()
+INTER_OP_THREADS = 1
+
 # 检查是否有可用的GPU
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+device = torch.device("cuda" if torch.cuda.is_available() and INFERENCE_MODE == 'fp32' else "cpu")
+torch.set_num_threads(INTRA_OP_THREADS)
+torch.set_num_interop_threads(INTER_OP_THREADS)
+print(f"Using device: {device}, CPU 线程数: 算子内 {torch.get_num_threads()}, 算子间 {torch.get_num_interop_threads()}")
+
+# 模型名称或本地路径
+MODEL_ID = 'roberta-base'
+
+MAX_LENGTH = 128  # 分词截断长度
+# 每批只补齐到批内最长的一条（不超过 MAX_LENGTH）；关闭时每批都补齐到 MAX_LENGTH
+ADAPTIVE_MAX_LENGTH = True
 
 # 加载RoBERTa模型和分词器
-tokenizer = RobertaTokenizer.from_pretrained('roberta-base')
-model = RobertaForSequenceClassification.from_pretrained('roberta-base', num_labels=4)  # 4分类情感任务
-model.to(device)
+def load_model(inference_mode):
+    """加载 fp32 模型；int8 模式下再量化（只能在 CPU 上运行），fp32 放到 device 上。
+    返回 (模型, fp32 权重指纹)"""
+    classifier = RobertaForSequenceClassification.from_pretrained(MODEL_ID, num_labels=4)  # 4分类情感任务
+    classifier.eval()
+    fingerprint = weights_fingerprint(classifier)
+    if inference_mode == 'int8':
+        return quantize_model(classifier), fingerprint
+    return classifier.to(device), fingerprint
+
+def weights_fingerprint(classifier):
+    """全部权重的哈希，写入标注缓存的键：换用微调后的模型，或者未微调的分类头在每次加载时重新随机初始化，
+    旧缓存都不会被命中（roberta-base 约需 1 秒）"""
+    digest = hashlib.blake2b(digest_size=16)
+    for name, tensor in sorted(classifier.state_dict().items()):
+        digest.update(f"{name}{tuple(tensor.shape)}{tensor.dtype}".encode('utf-8'))
+        digest.update(tensor.detach().cpu().contiguous().numpy().tobytes())
+    return digest.hexdigest()
+
+def quantize_model(classifier):
+    """对 fp32 模型的副本做动态 int8 量化，原模型不变。
+    分类头未经微调时每次 from_pretrained 都会随机初始化，对比精度时 int8 必须由同一份 fp32 权重量化得到"""
+    return torch.ao.quantization.quantize_dynamic(copy.deepcopy(classifier).cpu(), {torch.nn.Linear}, dtype=torch.qint8)
+
+tokenizer = RobertaTokenizer.from_pretrained(MODEL_ID)
+model, model_fingerprint = load_model(INFERENCE_MODE)
+emotion_map = {0: "Happy", 1: "Sad", 2: "Angry", 3: "Neutral"}
+
+# 批量推理：先收集所有 ASS 文件的逐条文本与窗口文本，按分词长度排序后分批前向，
+# 同一批内长度相近，补齐的填充很少；关闭时按原方式逐条调用模型
+BATCHED_INFERENCE_ENABLED = True
+INFERENCE_BATCH_SIZE = 64
+
+# 标注缓存：以 (权重指纹, 推理模式, 截断后的分词结果) 为键保存 logits 与标签，按最近访问时间淘汰；
+# 模型看到的输入相同才共用结果，命中与否不改变标签。批量推理时同一次运行中相同的输入也只经过模型一次
+EMOTION_CACHE_ENABLED = True
+EMOTION_CACHE_PATH = './emotion_cache/emotion_labels.sqlite'
+EMOTION_CACHE_MAX_BYTES = 256 * 1024 ** 2
 
 # 自定义情感分类函数
 def classify_emotion(texts):
-    inputs = tokenizer(texts, return_tensors="pt", padding=True, truncation=True, max_length=128).to(device)
+    inputs = tokenizer(texts, return_tensors="pt", padding=True, truncation=True, max_length=MAX_LENGTH).to(device)
     with torch.no_grad():
         outputs = model(**inputs)
     predictions = torch.argmax(outputs.logits, dim=-1).cpu().numpy()
-    emotion_map = {0: "Happy", 1: "Sad", 2: "Angry", 3: "Neutral"}
     return [emotion_map[pred] for pred in predictions]
 
+@torch.inference_mode()
+def emotion_logits_batched(texts, batch_size=INFERENCE_BATCH_SIZE, classifier=None, encodings=None):
+    """对任意数量的文本前向，返回与输入顺序一致的 [文本数, 类别数] logits；classifier 默认为当前模型，
+    已分词时可直接传入 encodings（截断后的 input_ids 列表）"""
+    if classifier is None:
+        classifier = model
+    logits = np.zeros((len(texts), len(emotion_map)), dtype=np.float32)
+    if not texts:
+        return logits
+    if encodings is None:
+        encodings = tokenize(texts)
+    # 按分词长度排序分桶，结果再按原下标写回
+    order = sorted(range(len(texts)), key=lambda i: len(encodings[i]))
+    for start in range(0, len(order), batch_size):
+        indices = order[start:start + batch_size]
+        padding = 'longest' if ADAPTIVE_MAX_LENGTH else 'max_length'
+        inputs = tokenizer.pad({'input_ids': [encodings[i] for i in indices]}, padding=padding,
+                               max_length=MAX_LENGTH, return_tensors="pt").to(classifier.device)
+        logits[indices] = classifier(**inputs).logits.float().cpu().numpy()
+    return logits
+
+def classify_emotions_batched(texts, batch_size=INFERENCE_BATCH_SIZE):
+    """对任意数量的文本分类，返回与输入顺序一致的情感标签列表"""
+    return [emotion_map[pred] for pred in emotion_logits_batched(texts, batch_size).argmax(axis=1)]
+
+_emotion_cache = None
+
+def get_emotion_cache():
+    """按需打开标注缓存，未启用时返回 None"""
+    global _emotion_cache
+    if EMOTION_CACHE_ENABLED and _emotion_cache is None:
+        _emotion_cache = DiskLRUCache(EMOTION_CACHE_PATH, EMOTION_CACHE_MAX_BYTES)
+    return _emotion_cache
+
+def tokenize(texts):
+    """分词并按 MAX_LENGTH 截断，返回 input_ids 列表"""
+    return tokenizer(texts, truncation=True, max_length=MAX_LENGTH)['input_ids']
+
+def emotion_cache_key(input_ids):
+    # 以模型实际看到的输入为键，只在截断部分之后不同的文本也共用结果；int8 与 fp32 的 logits 略有差异，分开缓存
+    return hashlib.blake2b(f"{model_fingerprint}:{INFERENCE_MODE}\0{' '.join(map(str, input_ids))}".encode('utf-8'),
+                           digest_size=16).hexdigest()
+
+def classify_emotions_cached(texts):
+    """按原文去重、分词后查缓存，只把未命中的输入送入模型，返回与输入顺序一致的标签列表"""
+    unique_texts = list(dict.fromkeys(texts))
+    encodings = dict(zip(unique_texts, tokenize(unique_texts)))
+    keys = {text: emotion_cache_key(encodings[text]) for text in unique_texts}
+    cache = get_emotion_cache()
+    results = cache.get_many(list(keys.values())) if cache is not None else {}
+    cache_hits = sum(keys[text] in results for text in unique_texts)
+
+    # 分词结果相同的文本只推理一次
+    pending = {}
+    for text in unique_texts:
+        if keys[text] not in results:
+            pending.setdefault(keys[text], text)
+    pending = list(pending.values())
+    logits = emotion_logits_batched(pending, encodings=[encodings[text] for text in pending])
+    computed = {keys[text]: {"logits": row, "label": emotion_map[int(row.argmax())]} for text, row in zip(pending, logits)}
+    results.update(computed)
+    if cache is not None:
+        cache.put_many(computed)
+
+    print(f"情感标注: {len(texts)} 条文本，去重后 {len(unique_texts)} 条，缓存命中 {cache_hits} 条，"
+          f"模型推理 {len(pending)} 条")
+    return [results[keys[text]]["label"] for text in texts]
+
 # 全局情感标注
 def get_global_emotion(texts):
     return classify_emotion([" ".join(texts)])[0]  # 对三条文本拼接后的全局情感标注
@@ -39,9 +181,12 @@ def convert_time_format(ass_time):
 # 处理ASS文件
 def process_ass_files(ass_files):
     result_json = []
+    local_texts = []  # 每条台词的文本，与 result_json 一一对应
+    window_texts = []  # 每个窗口拼接后的文本
+    window_of_line = []  # 每条台词所属窗口的下标
     
     # 按文件名顺序读取
-    for ass_file in sorted(ass_files, key=lambda x: int(x.split('.')[0])):
+    for ass_file in sorted(ass_files, key=lambda x: int(os.path.basename(x).split('.')[0])):
         subs = pysubs2.load(ass_file, encoding="utf-8")
         dialogues = [d for d in subs if d.type == "Dialogue"]
         
@@ -54,28 +199,70 @@ def process_ass_files(ass_files):
             while len(texts) < 3:
                 texts.append("")  # 确保窗口内有三条文本
             
-            # 获取全局情感标注
-            global_emotion = get_global_emotion(texts)
+            # 全局情感标注的输入：三条文本拼接
+            window_texts.append(" ".join(texts))
             
             for dialogue in group:
-                start_time = convert_time_format(dialogue.start.to_string())
-                end_time = convert_time_format(dialogue.end.to_string())
+                # pysubs2 的时间为整数毫秒
+                start_time = dialogue.start / 1000
+                end_time = dialogue.end / 1000
                 text_original = dialogue.text.strip()
-
-                # 获取局部情感标注
-                emotion_category = get_local_emotion(text_original)
+                local_texts.append(text_original)
+                window_of_line.append(len(window_texts) - 1)
                 
-                # 构造JSON结构
+                # 构造JSON结构，情感标注在全部文本收集完后统一填写
                 result_json.append({
                     "text_original": text_original,
                     "start_time": start_time,
                     "end_time": end_time,
-                    "emotion_category": emotion_category,
-                    "global_emotion": global_emotion
+                    "emotion_category": "",
+                    "global_emotion": ""
                 })
     
+    # 获取局部与全局情感标注
+    if BATCHED_INFERENCE_ENABLED:
+        labels = classify_emotions_cached(local_texts + window_texts)
+        local_emotions, global_emotions = labels[:len(local_texts)], labels[len(local_texts):]
+    else:
+        local_emotions = [get_local_emotion(text) for text in local_texts]
+        global_emotions = [classify_emotion([text])[0] for text in window_texts]
+    for item, emotion_category, window in zip(result_json, local_emotions, window_of_line):
+        item["emotion_category"] = emotion_category
+        item["global_emotion"] = global_emotions[window]
+    
     return result_json
 
+# 对比 fp32 与 int8 的一致性和耗时
+def benchmark_inference_modes(texts, report_path):
+    """在字幕语料（去重后的文本）上比较 fp32 与 int8：以 fp32 的标签为参照计算 int8 的一致率，
+    并记录两者的总耗时与每条平均耗时，结果写入 report_path。
+    int8 由同一份 fp32 权重量化得到，差异只来自量化；int8 只能在 CPU 上运行，fp32 也在 CPU 上计时，两者的耗时才可比"""
+    texts = list(dict.fromkeys(texts))
+    cpu = torch.device('cpu')
+    report = {"texts": len(texts), "device": str(cpu), "intra_op_threads": torch.get_num_threads(),
+              "inter_op_threads": torch.get_num_interop_threads(), "adaptive_max_length": ADAPTIVE_MAX_LENGTH}
+    # 当前模型是 fp32 时复用它的权重（在 GPU 上时拷贝一份到 CPU），否则重新加载一份 fp32
+    if INFERENCE_MODE == 'fp32':
+        fp32_model = model if device == cpu else copy.deepcopy(model).to(cpu)
+    else:
+        fp32_model = RobertaForSequenceClassification.from_pretrained(MODEL_ID, num_labels=4).eval()
+    classifiers = {'fp32': fp32_model, 'int8': quantize_model(fp32_model)}
+    logits = {}
+    for inference_mode, classifier in classifiers.items():
+        emotion_logits_batched(texts[:INFERENCE_BATCH_SIZE], classifier=classifier)  # 预热
+        start = time.perf_counter()
+        logits[inference_mode] = emotion_logits_batched(texts, classifier=classifier)
+        seconds = time.perf_counter() - start
+        report[inference_mode] = {"seconds": round(seconds, 3), "ms_per_text": round(seconds * 1000 / max(len(texts), 1), 3)}
+    agreement = (logits['fp32'].argmax(axis=1) == logits['int8'].argmax(axis=1)).mean() if texts else 1.0
+    report["int8_label_agreement"] = round(float(agreement), 4)
+    report["int8_max_logit_diff"] = round(float(np.abs(logits['fp32'] - logits['int8']).max()), 4) if texts else 0.0
+    report["int8_speedup"] = round(report['fp32']['seconds'] / max(report['int8']['seconds'], 1e-9), 2)
+    save_json_file(report_path, report)
+    print(f"fp32: {report['fp32']['ms_per_text']} ms/条, int8: {report['int8']['ms_per_text']} ms/条 "
+          f"(加速 {report['int8_speedup']}x), 标签一致率 {report['int8_label_agreement']:.2%}")
+    return report
+
 # 保存JSON文件
 def save_json_file(output_path, data):
     with open(output_path, 'w', encoding='utf-8') as f:
@@ -87,6 +274,14 @@ def main():
     ass_folder = "../ass_file_set"
     ass_files = [os.path.join(ass_folder, f) for f in os.listdir(ass_folder) if f.endswith('.ass')]
     
+    if '--benchmark' in sys.argv:
+        # 只在字幕语料上对比 fp32 与 int8，不生成标注结果
+        texts = []
+        for ass_file in ass_files:
+            texts.extend(d.text.strip() for d in pysubs2.load(ass_file, encoding="utf-8") if d.type == "Dialogue")
+        benchmark_inference_modes(texts, "inference_report.json")
+        return
+    
     # 处理ASS文件并生成JSON数据
     result_data = process_ass_files(ass_files)
     
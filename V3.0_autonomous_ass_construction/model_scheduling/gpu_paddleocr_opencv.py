@@ -1,14 +1,42 @@
 import cv2
 import os
 import time
-from paddleocr import PaddleOCR
+import queue
+import threading
+from collections import deque, Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 import numpy as np
 from difflib import SequenceMatcher  # 用于比较相似度
 import re  # 用于处理文本中的特殊符号
+import subprocess
+import tempfile
+import sys
+import json
+import hashlib
 
-# 初始化PaddleOCR，启用GPU
-ocr = PaddleOCR(use_angle_cls=True, lang='ch', use_gpu=True)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import DiskLRUCache
+
+# OCR配置标识，写入缓存键，配置变化后旧缓存自然失效
+OCR_ENGINE_ID = 'paddleocr-ch-angle_cls'
+
+def create_ocr_engine():
+    """创建PaddleOCR实例，流水线中每个OCR工作线程各持有一个"""
+    # 用到时才导入：只调用合并、生成ASS等函数（如测试）时不需要 PaddlePaddle 和 GPU
+    from paddleocr import PaddleOCR
+    return PaddleOCR(use_angle_cls=True, lang='ch', use_gpu=True)
+
+# 全局共享的PaddleOCR实例（启用GPU），第一次用到时才创建
+_default_ocr = None
+_default_ocr_lock = threading.Lock()
+
+def default_ocr_engine():
+    global _default_ocr
+    with _default_ocr_lock:
+        if _default_ocr is None:
+            _default_ocr = create_ocr_engine()
+    return _default_ocr
 
 # 视频文件路径和ASS文件路径————提取完毕应当封存————————————————————————————————————————————————————————————————————
 # video_files_set = '../../Video_file_set'
@@ -18,6 +46,80 @@ ocr = PaddleOCR(use_angle_cls=True, lang='ch', use_gpu=True)
 # 每秒采样帧数
 FRAME_RATE = 10
 
+# 抽帧模式：
+# 'read' —— 逐帧 read()，解码并转换所有帧后丢弃未采样帧（原始做法，用于对比）
+# 'grab' —— 未采样帧只 grab() 推进，不做颜色转换和拷贝，仅采样帧 retrieve()
+# 'seek' —— 直接定位到下一采样帧（关键帧+向后解码），仅在采样间隔很大时划算
+SAMPLING_MODE = 'grab'
+
+# 帧来源：
+# 'opencv' —— cv2.VideoCapture 解码整帧 BGR，再在 Python 中转灰度、裁剪
+# 'ffmpeg' —— 由 ffmpeg 完成抽帧、裁剪和灰度转换，通过管道只把字幕条读入可复用的 NumPy 缓冲区
+FRAME_SOURCE = 'opencv'
+
+# 字幕区域变化检测：字幕条未变化时复用上一次的OCR结果。
+# 默认关闭：开启前先用 verify_change_gate 在真实剧集上确认没有漏检的换行
+CHANGE_GATE_ENABLED = False
+# 字幕条按 BAND_BLOCK_SIZE×BAND_BLOCK_SIZE 像素分块取平均，任一块的平均像素差（0-255）超过阈值即视为变化。
+# 只看最大的局部差异：短字幕只占字幕条的一小部分，整条平均会把换行的差异稀释到噪声水平
+CHANGE_THRESHOLD = 24.0
+BAND_BLOCK_SIZE = 8
+
+# OCR批大小：多张字幕条纵向拼接后一次识别（1 表示逐帧识别）
+OCR_BATCH_SIZE = 8
+# 拼接时字幕条之间的空白行数，避免检测框跨帧
+OCR_BATCH_GAP = 16
+
+# 流水线并行：解码线程 -> 预处理线程池 -> 变化检测/凑批 -> OCR工作线程（各自持有PaddleOCR实例）
+PIPELINE_ENABLED = True
+PREPROCESS_WORKERS = 8
+OCR_WORKERS = 2
+# 解码帧队列上限，限制内存中待处理的整帧数量
+PIPELINE_QUEUE_SIZE = 64
+
+# 同时处理的视频数量，以及所有视频共享的工作线程预算
+MAX_PARALLEL_VIDEOS = 2
+WORKER_BUDGET = 32
+
+# 粗到细的字幕边界搜索：先低帧率稀疏采样找出每条字幕，再只在文本变化处二分，把起止时间定位到帧
+ADAPTIVE_SEARCH_ENABLED = False
+# 粗采样的每秒帧数（字幕通常持续 1-4 秒，每条至少能被采到一次）
+COARSE_FRAME_RATE = 2
+# 二分阶段从前一个区间的末尾顺序 grab 到下一个区间；相距超过该帧数时改为按帧号定位一次
+# （定位由解码器从前一个关键帧向后解码，代价与 GOP 长度有关，不计入解码帧数，单独统计次数）
+REFINE_SEEK_GAP = 250
+
+# OCR结果磁盘缓存：以增强后字幕条的内容哈希为键保存PaddleOCR原始输出，
+# 同时为每个视频记录逐帧使用的缓存键，调整阈值后可直接用 rebuild_ass_from_cache 重新生成ASS
+OCR_CACHE_ENABLED = True
+OCR_CACHE_DIR = './ocr_cache'
+OCR_CACHE_MAX_BYTES = 2 * 1024 ** 3  # 缓存总大小上限，超过后按最近访问时间淘汰
+
+_ocr_cache = None
+_ocr_cache_lock = threading.Lock()
+
+# 断点续跑：定期把已生成的字幕元组与最后处理的帧序号写入检查点，重启后从该帧继续
+CHECKPOINT_DIR = './extract_checkpoints'
+CHECKPOINT_INTERVAL = 60  # 两次检查点之间的最短间隔（秒）
+# 帧来源停止的位置与 CAP_PROP_FRAME_COUNT 相差不超过该秒数时视为读到了视频末尾
+# （部分容器的总帧数是按时长估算的）；差得更多说明解码提前中断，不标记为已完成，下次重新提取
+END_OF_VIDEO_TOLERANCE = 2.0
+
+# 字幕区域自动标定：均匀抽取少量帧在默认裁剪范围内识别，按通过字号与置信度过滤的文本框实际位置
+# 收紧裁剪范围，整段视频沿用；标定结果随检查点保存，断点续跑前后保持一致
+ROI_CALIBRATION_ENABLED = True
+ROI_CALIBRATION_FRAMES = 300
+ROI_MIN_BOXES = 20  # 有效文本框少于该数量时沿用默认裁剪范围
+ROI_MARGIN = 0.5  # 文本框四周外扩的边距（以行高为单位）
+
+# 仅识别模式：字幕行位置稳定时跳过文本检测，把整条收紧后的字幕条直接交给识别模型
+REC_ONLY_ENABLED = False
+ROI_STABLE_TOLERANCE = 0.25  # 所有文本框中心纵坐标偏离中位数不超过该值（以行高为单位）时视为单行且位置稳定
+# 仅识别模式下包上的标定文本框总能通过字号过滤，因此按行的水平梯度估计字幕条内文字的高度，
+# 超出标定时有字幕帧的范围（上下各放宽该比例）的字幕条改走检测+识别，由字号与置信度过滤照常判断
+REC_ONLY_HEIGHT_TOLERANCE = 0.25
+TEXT_ROW_ENERGY_RATIO = 0.3  # 行的水平梯度均值达到字幕条内最大值的该比例时视为文字所在的行
+
 # 字体大小阈值（作为高度的百分比）
 FONT_SIZE_THRESHOLD = 0.045  # 筛掉背景字幕的阈值
 
@@ -94,85 +196,1007 @@ def filter_by_font_size_and_confidence(ocr_result, frame_height):
 
 def enhance_frame(frame):
     """增强视频帧的可读性以提高OCR识别的精度"""
-    gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    # ffmpeg 帧来源输出的已经是灰度图
+    gray_frame = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
     # 应用轻微的锐化处理
     kernel = np.array([[0, -1, 0], [-1, 5, -1], [0, -1, 0]])
     sharpened_frame = cv2.filter2D(gray_frame, -1, kernel)
     return sharpened_frame
 
-def extract_subtitles(video_path, ass_output_path):
-    """从视频中提取字幕并生成ASS文件"""
-    video_capture = cv2.VideoCapture(video_path)
-    
-    total_frames = int(video_capture.get(cv2.CAP_PROP_FRAME_COUNT))
-    fps = int(video_capture.get(cv2.CAP_PROP_FPS))
-    frame_width = int(video_capture.get(cv2.CAP_PROP_FRAME_WIDTH))
-    frame_height = int(video_capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    
-    frame_interval = fps // FRAME_RATE
-    
-    subtitles = []
-    confidence_scores = []
-    frame_index = 0
-    last_text = ""
-    start_timestamp = None
-    end_timestamp = None  # 记录当前字幕的结束时间
-    
-    bottom_crop_start = int(frame_height * 0.89)
-    bottom_crop_end = frame_height
-    left_crop = int(frame_width * 0.10)
-    right_crop = int(frame_width * 0.90)
+def subtitle_crop_box(frame_height, frame_width):
+    """字幕条在整帧中的裁剪范围 (上, 下, 左, 右)"""
+    return int(frame_height * 0.89), frame_height, int(frame_width * 0.10), int(frame_width * 0.90)
+
+def preprocess_frame(frame, crop_box):
+    """增强整帧后裁剪出字幕条"""
+    top, bottom, left, right = crop_box
+    return enhance_frame(frame)[top:bottom, left:right]
+
+def band_signature(cropped_frame):
+    """将字幕条按 BAND_BLOCK_SIZE 像素分块取平均，作为廉价的变化检测特征"""
+    height, width = cropped_frame.shape[:2]
+    size = (max(width // BAND_BLOCK_SIZE, 1), max(height // BAND_BLOCK_SIZE, 1))
+    return cv2.resize(cropped_frame, size, interpolation=cv2.INTER_AREA).astype(np.float32)
+
+def text_row_energy(band):
+    """字幕条每一行的水平梯度均值，文字笔画所在的行明显高于背景"""
+    return np.abs(np.diff(band.astype(np.int16), axis=1)).mean(axis=1)
+
+def text_row_span(row_energy):
+    """由 text_row_energy 估计文字占据的行数，没有明显笔画时返回 0"""
+    if row_energy.size == 0 or row_energy.max() <= 0:
+        return 0
+    rows = np.flatnonzero(row_energy >= row_energy.max() * TEXT_ROW_ENERGY_RATIO)
+    return int(rows[-1] - rows[0] + 1)
 
-    pbar = tqdm(total=total_frames // frame_interval, desc="Processing frames", unit="frame")
+def band_changed(previous_signature, signature):
+    """比较两帧各分块的平均像素差，任一块差异超过阈值即认为字幕条发生变化"""
+    if previous_signature is None or previous_signature.shape != signature.shape:
+        return True
+    return float(np.max(np.abs(signature - previous_signature))) > CHANGE_THRESHOLD
+
+def iter_sampled_frames(video_capture, frame_interval, mode=SAMPLING_MODE, stats=None, start_frame=0):
+    """按采样间隔迭代视频帧，返回 (帧序号, 时间戳秒, 帧)，未采样帧尽量不做解码后的转换；
+    结束时在 stats['position'] 中记录读取停止处的帧序号，用于判断是否读到了视频末尾"""
+    if stats is None:
+        stats = {}
+    stats.update(mode=mode, advanced=0, sampled=0)
+    frame_index = start_frame
+    if start_frame:
+        video_capture.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
 
     while True:
-        ret, frame = video_capture.read()
-        if not ret:
+        # 读取在这里停止时，该帧及之后的帧都没有读到
+        stats['position'] = frame_index
+        if mode == 'read':
+            ret, frame = video_capture.read()
+            if not ret:
+                break
+            stats['advanced'] += 1
+            if frame_index % frame_interval != 0:
+                frame_index += 1
+                continue
+        elif mode == 'grab':
+            # grab() 只推进解码器，跳过 BGR 转换与内存拷贝
+            if not video_capture.grab():
+                break
+            stats['advanced'] += 1
+            if frame_index % frame_interval != 0:
+                frame_index += 1
+                continue
+            ret, frame = video_capture.retrieve()
+            if not ret:
+                break
+        elif mode == 'seek':
+            # 定位到采样帧，由解码器从最近的关键帧向后解码
+            video_capture.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+            ret, frame = video_capture.read()
+            if not ret:
+                break
+            stats['advanced'] += frame_interval
+        else:
+            raise ValueError(f"未知的抽帧模式: {mode}")
+
+        stats['sampled'] += 1
+        yield frame_index, video_capture.get(cv2.CAP_PROP_POS_MSEC) / 1000, frame
+
+        if mode == 'seek':
+            frame_index += frame_interval
+        else:
+            frame_index += 1
+
+def read_video_info(video_path):
+    """读取视频的总帧数、帧率和尺寸"""
+    video_capture = cv2.VideoCapture(video_path)
+    info = {
+        'total_frames': int(video_capture.get(cv2.CAP_PROP_FRAME_COUNT)),
+        'fps': video_capture.get(cv2.CAP_PROP_FPS),
+        'width': int(video_capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        'height': int(video_capture.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+    }
+    video_capture.release()
+    return info
+
+def iter_opencv_frames(video_path, frame_interval, stats=None, start_frame=0):
+    """用 cv2.VideoCapture 按 SAMPLING_MODE 抽取整帧"""
+    video_capture = cv2.VideoCapture(video_path)
+    try:
+        yield from iter_sampled_frames(video_capture, frame_interval, SAMPLING_MODE, stats, start_frame)
+    finally:
+        video_capture.release()
+
+def read_exact_into(stream, view):
+    """管道可能分多次返回数据，循环读取直到填满缓冲区或遇到流结束"""
+    filled = 0
+    while filled < len(view):
+        count = stream.readinto(view[filled:])
+        if not count:
             break
+        filled += count
+    return filled
+
+def iter_ffmpeg_band_frames(video_path, fps, frame_interval, crop_box, stats=None, buffer_count=2, start_frame=0):
+    """由 ffmpeg 选帧、裁剪并转为灰度，原始字节经管道直接读入轮换使用的 NumPy 缓冲区。
+
+    返回的帧是缓冲区的视图，在之后 buffer_count - 1 帧内有效，需要更久保留时由调用方拷贝。
+    读到流结束后检查 ffmpeg 的返回码，解码失败或最后一帧不完整时抛出 RuntimeError（附 stderr 末尾），
+    不会被当成一个较短或空的视频。
+    """
+    if stats is None:
+        stats = {}
+    stats.update(mode='ffmpeg', advanced=0, sampled=0)
+
+    top, bottom, left, right = crop_box
+    band_height, band_width = bottom - top, right - left
+    video_filter = (f"select=not(mod(n\\,{frame_interval})),"
+                    f"crop={band_width}:{band_height}:{left}:{top}:exact=1,format=gray")
+    command = [
+        "ffmpeg", "-v", "error", "-ss", str(start_frame / fps), "-i", video_path, "-vf", video_filter,
+        "-vsync", "passthrough", "-f", "rawvideo", "-pix_fmt", "gray", "pipe:1"
+    ]
+    buffers = np.empty((buffer_count, band_height, band_width), dtype=np.uint8)
+    frame_bytes = band_height * band_width
+
+    # stderr 写入临时文件而不是管道，ffmpeg 输出大量错误时也不会因管道写满而阻塞
+    stderr = tempfile.TemporaryFile()
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr, bufsize=frame_bytes * 4)
+    exited = False
+    try:
+        sample_index = 0
+        while True:
+            buffer = buffers[sample_index % buffer_count]
+            filled = read_exact_into(process.stdout, memoryview(buffer).cast('B'))
+            if filled < frame_bytes:
+                break
+            frame_index = start_frame + sample_index * frame_interval
+            stats['advanced'] += frame_interval
+            stats['sampled'] += 1
+            yield frame_index, frame_index / fps, buffer
+            sample_index += 1
+        # select 滤镜之后最后一个采样间隔内的帧也已被 ffmpeg 读过
+        stats['position'] = start_frame + sample_index * frame_interval
+        returncode = process.wait()
+        exited = True
+        if returncode != 0 or filled:
+            stderr.seek(0)
+            tail = stderr.read()[-2000:].decode('utf-8', errors='replace').strip()
+            reason = f"返回码 {returncode}" if returncode != 0 else f"最后一帧只读到 {filled}/{frame_bytes} 字节"
+            raise RuntimeError(f"ffmpeg 解码失败（{reason}）: {video_path}\n{tail}")
+    finally:
+        process.stdout.close()
+        # 只有提前退出（生成器被关闭或出错）时才需要结束仍在运行的 ffmpeg
+        if not exited:
+            process.kill()
+            process.wait()
+        stderr.close()
+
+def expand_crop_box(crop_box, frame_height, frame_width):
+    """在字幕条四周各多裁 1 像素（不超出画面），使裁剪后再锐化与整帧锐化后再裁剪的结果一致。
+    返回 (扩展后的裁剪范围, 字幕条在扩展图中的位置)"""
+    top, bottom, left, right = crop_box
+    expanded = (max(top - 1, 0), min(bottom + 1, frame_height), max(left - 1, 0), min(right + 1, frame_width))
+    inner_top, inner_left = top - expanded[0], left - expanded[2]
+    return expanded, (inner_top, inner_top + bottom - top, inner_left, inner_left + right - left)
+
+def open_frame_source(video_path, video_info, frame_interval, crop_box, stats=None, buffer_count=2, start_frame=0):
+    """按 FRAME_SOURCE 打开帧来源，返回 (帧迭代器, 字幕条在来源帧中的裁剪范围)"""
+    if FRAME_SOURCE == 'ffmpeg':
+        expanded_box, inner_box = expand_crop_box(crop_box, video_info['height'], video_info['width'])
+        frames = iter_ffmpeg_band_frames(video_path, video_info['fps'], frame_interval, expanded_box, stats,
+                                         buffer_count, start_frame)
+        return frames, inner_box
+    if FRAME_SOURCE == 'opencv':
+        return iter_opencv_frames(video_path, frame_interval, stats, start_frame), crop_box
+    raise ValueError(f"未知的帧来源: {FRAME_SOURCE}")
+
+def report_sampling_stats(stats, elapsed):
+    """打印实际有效帧率，便于在同一文件上对比不同抽帧模式"""
+    if not stats or elapsed <= 0:
+        return
+    print(f"抽帧模式: {stats['mode']}, 推进帧数: {stats['advanced']}, 采样帧数: {stats['sampled']}, "
+          f"耗时: {elapsed:.1f}s, 有效帧率: {stats['sampled'] / elapsed:.2f} 帧/秒, "
+          f"视频推进速度: {stats['advanced'] / elapsed:.2f} 帧/秒")
+
+def benchmark_sampling_modes(video_path, modes=('read', 'grab', 'seek'), max_frames=3000):
+    """只抽帧不做OCR，在同一视频上对比各抽帧模式的有效帧率"""
+    for mode in modes:
+        video_capture = cv2.VideoCapture(video_path)
+        fps = int(video_capture.get(cv2.CAP_PROP_FPS))
+        frame_interval = max(fps // FRAME_RATE, 1)
+        stats = {}
+        start_time = time.perf_counter()
+        for frame_index, _, _ in iter_sampled_frames(video_capture, frame_interval, mode, stats):
+            if frame_index >= max_frames:
+                break
+        report_sampling_stats(stats, time.perf_counter() - start_time)
+        video_capture.release()
+
+def get_ocr_cache():
+    """按需打开全局共享的OCR缓存，未启用时返回 None"""
+    global _ocr_cache
+    if not OCR_CACHE_ENABLED:
+        return None
+    with _ocr_cache_lock:
+        if _ocr_cache is None:
+            _ocr_cache = DiskLRUCache(os.path.join(OCR_CACHE_DIR, 'ocr_results.sqlite'), OCR_CACHE_MAX_BYTES)
+    return _ocr_cache
 
-        if frame_index % frame_interval == 0:
-            # 使用增强函数处理帧
-            enhanced_frame = enhance_frame(frame)
-            # 裁剪增强后的帧
-            cropped_frame = enhanced_frame[bottom_crop_start:bottom_crop_end, left_crop:right_crop]
+def band_cache_key(band, line_box=None, text_rows=None):
+    """字幕条的内容哈希，包含尺寸与OCR配置；仅识别模式的结果另加文本框位置与文字高度范围区分"""
+    digest = hashlib.blake2b(band.tobytes(), digest_size=16)
+    digest.update(f"{band.shape}{OCR_ENGINE_ID}".encode('utf-8'))
+    if line_box is not None:
+        digest.update(f"rec{line_box}{text_rows}".encode('utf-8'))
+    return digest.hexdigest()
 
-            bottom_result = ocr.ocr(cropped_frame)
-            filtered_result, frame_confidences = filter_by_font_size_and_confidence(bottom_result, frame_height)
+def frame_log_path(video_path):
+    """每个视频的逐帧缓存键记录文件"""
+    return os.path.join(OCR_CACHE_DIR, f'{os.path.splitext(os.path.basename(video_path))[0]}.frames.json')
 
-            confidence_scores.extend(frame_confidences)
+def save_frame_log(video_path, frame_height, frame_log):
+    """保存逐帧 (时间戳, 缓存键) 记录，供不解码视频直接重建ASS"""
+    if not OCR_CACHE_ENABLED or not frame_log:
+        return
+    os.makedirs(OCR_CACHE_DIR, exist_ok=True)
+    with open(frame_log_path(video_path), 'w', encoding='utf-8') as f:
+        json.dump({'video': video_path, 'frame_height': frame_height, 'frames': frame_log}, f)
 
-            if filtered_result:
-                try:
-                    current_text = ''.join([normalize_text(word[1][0]) for word in filtered_result])
-                except Exception as e:
-                    print(f"Error processing OCR result: {e}")
-                    current_text = ""
+def remove_frame_log(video_path):
+    """删除视频的逐帧记录，不产生逐帧记录的提取方式用它避免旧记录被误用"""
+    if os.path.exists(frame_log_path(video_path)):
+        os.remove(frame_log_path(video_path))
 
-                if len(current_text) < MIN_TEXT_LENGTH:
-                    current_text = ""
+def rebuild_ass_from_cache(video_path, ass_output_path):
+    """只用缓存中的OCR原始结果重新执行阈值过滤与ASS合并，不解码视频、不调用OCR"""
+    if not OCR_CACHE_ENABLED:
+        raise RuntimeError("OCR缓存未启用（OCR_CACHE_ENABLED = False），无法从缓存重建ASS")
+    if not os.path.exists(frame_log_path(video_path)):
+        raise FileNotFoundError(f"{video_path} 没有逐帧记录（粗到细模式不生成），需要用逐帧或流水线模式重新提取")
+    with open(frame_log_path(video_path), 'r', encoding='utf-8') as f:
+        frame_log = json.load(f)
+    results = get_ocr_cache().get_many([key for _, key in frame_log['frames']])
+    missing = sum(1 for _, key in frame_log['frames'] if key not in results)
+    if missing:
+        raise KeyError(f"{video_path} 有 {missing} 帧的OCR结果已被缓存淘汰，需要重新提取")
 
-                if last_text == "" and current_text:
-                    start_timestamp = video_capture.get(cv2.CAP_PROP_POS_MSEC) / 1000
+    tracker = SubtitleTracker(frame_log['frame_height'])
+    for timestamp, key in frame_log['frames']:
+        tracker.feed(timestamp, results[key])
+    generate_ass(tracker.subtitles, ass_output_path)
 
-                if current_text:
-                    subtitles.append((start_timestamp, video_capture.get(cv2.CAP_PROP_POS_MSEC) / 1000, current_text))
+def max_ocr_batch_size(band_height, band_width):
+    """拼接图高度不超过宽度时，检测模型的缩放比例与单帧一致，以此限制批大小"""
+    return max(1, (band_width + OCR_BATCH_GAP) // (band_height + OCR_BATCH_GAP))
 
-                last_text = current_text
+def ocr_batch(ocr_engine, bands):
+    """将多张字幕条纵向拼接后一次完成检测与识别，再按纵坐标拆回每帧结果（格式与 ocr.ocr 单帧输出一致）"""
+    if len(bands) == 1:
+        return [ocr_engine.ocr(bands[0])]
+
+    band_height, band_width = bands[0].shape[:2]
+    stride = band_height + OCR_BATCH_GAP
+    mosaic = np.zeros((stride * len(bands) - OCR_BATCH_GAP, band_width), dtype=bands[0].dtype)
+    for i, band in enumerate(bands):
+        mosaic[i * stride:i * stride + band_height] = band
+
+    mosaic_result = ocr_engine.ocr(mosaic)
+
+    # 按文本框中心的纵坐标归属到对应帧，并把坐标平移回单帧坐标系
+    per_frame_words = [[] for _ in bands]
+    for line in mosaic_result or []:
+        if not isinstance(line, list):
+            continue
+        for word_info in line:
+            box = word_info[0]
+            center_y = sum(point[1] for point in box) / len(box)
+            i = min(int(center_y // stride), len(bands) - 1)
+            offset = i * stride
+            per_frame_words[i].append([[[point[0], point[1] - offset] for point in box], word_info[1]])
+
+    return [[words] if words else [None] for words in per_frame_words]
+
+def ocr_rec_only_batch(ocr_engine, bands, line_box, text_rows):
+    """跳过检测，整条字幕条直接送入识别模型（一次调用内部按 rec_batch_num 批量识别），
+    再包上标定得到的文本框，输出格式与 ocr.ocr 单帧输出一致。
+
+    标定文本框的高度总能通过字号过滤，因此识别出文字的字幕条先按 text_rows（标定时有字幕帧的文字行数范围）复检，
+    文字高度不在范围内的（如字号不同的背景文字）改走检测+识别，由后续的字号过滤照常判断。返回 (结果, 复检条数)"""
+    images = [cv2.cvtColor(band, cv2.COLOR_GRAY2BGR) if band.ndim == 2 else band for band in bands]
+    rec_results, _ = ocr_engine.text_recognizer(images)
+    results = [[[[line_box, (text, score)]]] if text else [None] for text, score in rec_results]
+
+    low, high = text_rows[0] * (1 - REC_ONLY_HEIGHT_TOLERANCE), text_rows[1] * (1 + REC_ONLY_HEIGHT_TOLERANCE)
+    recheck = [i for i, (text, _) in enumerate(rec_results)
+               if text and not low <= text_row_span(text_row_energy(bands[i])) <= high]
+    if recheck:
+        for i, result in zip(recheck, ocr_batch(ocr_engine, [bands[i] for i in recheck])):
+            results[i] = result
+    return results, len(recheck)
+
+class OcrDispatcher:
+    """按帧顺序接收字幕条：变化检测决定是否需要OCR，需要OCR的字幕条凑批后统一识别，
+    并按原顺序输出 (时间戳, 原始OCR结果)。
+
+    plan / run_job / resolve 三步可拆开使用：plan 与 resolve 必须按帧顺序调用，
+    run_job 可以交给任意OCR工作线程并行执行。
+    """
+
+    def __init__(self, ocr_engine, batch_size=None):
+        self.ocr_engine = ocr_engine
+        self.batch_size = batch_size or OCR_BATCH_SIZE
+        self.last_signature = None  # 上一张送去OCR的字幕条特征
+        self.anchor_count = 0  # 已送去OCR的字幕条数量
+        self.last_result = None  # 上一批最后一张字幕条的OCR结果
+        self.batch_bands = []
+        self.pending_frames = []  # (时间戳, 对应的OCR字幕条序号)
+        self.stats = {'calls': 0, 'bands': 0, 'seconds': 0.0, 'cached': 0, 'rechecked': 0}
+        self.stats_lock = threading.Lock()
+        self.last_key = None
+        self.frame_log = []  # 按帧顺序记录 (时间戳, 缓存键)
+        self.line_box = None  # 仅识别模式下字幕条内的文本框，None 表示检测+识别
+        self.text_rows = None  # 仅识别模式下用于复检的文字行数范围 [最小, 最大]
+
+    def submit(self, timestamp, band):
+        """提交一帧字幕条，返回已经可以按顺序交给状态机的帧"""
+        job = self.plan(timestamp, band)
+        return self.execute(job) if job else []
+
+    def flush(self):
+        """识别剩余的字幕条，并输出所有结果已就绪的帧"""
+        return self.execute(self.plan_flush())
+
+    def plan(self, timestamp, band):
+        """变化检测并凑批，批次凑满时返回一个待识别的任务"""
+        if self.anchor_count == 0 and self.line_box is None:
+            self.batch_size = min(self.batch_size, max_ocr_batch_size(*band.shape[:2]))
+
+        # 字幕条未变化时复用上一次的OCR结果，结束时间随当前帧自然延长
+        signature = band_signature(band)
+        if not CHANGE_GATE_ENABLED or band_changed(self.last_signature, signature):
+            self.batch_bands.append(band)
+            self.last_signature = signature
+            self.anchor_count += 1
+        self.pending_frames.append((timestamp, self.anchor_count - 1))
+
+        if len(self.batch_bands) >= self.batch_size:
+            return self.plan_flush()
+        return None
+
+    def plan_flush(self):
+        """把当前凑到的字幕条和等待中的帧打包成一个任务"""
+        job = {
+            'first_anchor': self.anchor_count - len(self.batch_bands),
+            'bands': self.batch_bands,
+            'frames': self.pending_frames,
+        }
+        self.batch_bands = []
+        self.pending_frames = []
+        return job
+
+    def run_job(self, job, ocr_engine=None):
+        """识别一个任务中的全部字幕条，可在任意OCR工作线程中调用；启用缓存时只识别未命中的字幕条"""
+        bands = job['bands']
+        if not bands:
+            return []
+
+        cache = get_ocr_cache()
+        results = [None] * len(bands)
+        pending = list(range(len(bands)))
+        if cache is not None:
+            job['keys'] = [band_cache_key(band, self.line_box, self.text_rows) for band in bands]
+            cached = cache.get_many(job['keys'])
+            pending = [i for i, key in enumerate(job['keys']) if key not in cached]
+            for i, key in enumerate(job['keys']):
+                if key in cached:
+                    results[i] = cached[key]
+
+        ocr_start = time.perf_counter()
+        rechecked = 0
+        if pending:
+            ocr_engine = ocr_engine or self.ocr_engine
+            pending_bands = [bands[i] for i in pending]
+            if self.line_box is None:
+                pending_results = ocr_batch(ocr_engine, pending_bands)
+            else:
+                pending_results, rechecked = ocr_rec_only_batch(ocr_engine, pending_bands, self.line_box, self.text_rows)
+            for i, result in zip(pending, pending_results):
+                results[i] = result
+            if cache is not None:
+                cache.put_many({job['keys'][i]: results[i] for i in pending})
+        with self.stats_lock:
+            self.stats['seconds'] += time.perf_counter() - ocr_start
+            self.stats['calls'] += 1 if pending else 0
+            self.stats['bands'] += len(pending)
+            self.stats['cached'] += len(bands) - len(pending)
+            self.stats['rechecked'] += rechecked
+        return results
+
+    def resolve(self, job, results):
+        """按帧顺序展开任务结果，任务必须按生成顺序依次传入"""
+        ready = []
+        keys = job.get('keys')
+        for timestamp, anchor in job['frames']:
+            if anchor >= job['first_anchor']:
+                ready.append((timestamp, results[anchor - job['first_anchor']]))
+                key = keys[anchor - job['first_anchor']] if keys else None
             else:
-                if last_text:
-                    end_timestamp = video_capture.get(cv2.CAP_PROP_POS_MSEC) / 1000
-                    subtitles.append((start_timestamp, end_timestamp, last_text))
-                    last_text = ""
+                # 引用的是上一批最后一张字幕条
+                ready.append((timestamp, self.last_result))
+                key = self.last_key
+            if key is not None:
+                self.frame_log.append((timestamp, key))
+        if results:
+            self.last_result = results[-1]
+            self.last_key = keys[-1] if keys else None
+        return ready
+
+    def execute(self, job):
+        return self.resolve(job, self.run_job(job))
+
+    def report(self, sampled_frames):
+        """打印OCR调用次数与当前批大小下的吞吐量"""
+        seconds = self.stats['seconds']
+        throughput = self.stats['bands'] / seconds if seconds > 0 else 0.0
+        print(f"OCR批大小: {self.batch_size}, OCR调用次数: {self.stats['calls']}, "
+              f"识别字幕条: {self.stats['bands']}/{sampled_frames}, 缓存命中: {self.stats['cached']}, "
+              f"仅识别复检: {self.stats['rechecked']}, OCR耗时: {seconds:.1f}s, "
+              f"OCR吞吐量: {throughput:.2f} 条/秒")
+
+def calibrate_subtitle_roi(video_path, video_info, ocr_engine):
+    """均匀定位抽取 ROI_CALIBRATION_FRAMES 帧，在默认裁剪范围内识别，统计通过字号与置信度过滤的文本框。
+    返回 {'crop_box': 收紧后的整帧裁剪范围, 'line_box': 行位置稳定时字幕条内的文本框，否则 None,
+    'text_rows': 行位置稳定时收紧后的字幕条内文字行数的范围，否则 None}，
+    有效文本框不足时返回 None。ocr_engine 须由调用方所在的视频独占，PaddleOCR 预测器不能被多个线程同时调用"""
+    frame_height, frame_width = video_info['height'], video_info['width']
+    default_box = subtitle_crop_box(frame_height, frame_width)
+    default_top, default_bottom, default_left, default_right = default_box
+    total_frames = video_info['total_frames']
+    sample_count = min(ROI_CALIBRATION_FRAMES, total_frames)
+
+    # 用帧序号代替时间戳在调度器中流转，凑批与缓存照常生效
+    dispatcher = OcrDispatcher(ocr_engine)
+    results = []
+    row_energies = {}  # 帧序号 -> 默认字幕条的 text_row_energy
+    video_capture = cv2.VideoCapture(video_path)
+    try:
+        for i in range(sample_count):
+            frame_index = (2 * i + 1) * total_frames // (2 * sample_count)
+            video_capture.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+            ret, frame = video_capture.read()
+            if not ret:
+                continue
+            band = preprocess_frame(frame, default_box)
+            row_energies[frame_index] = text_row_energy(band)
+            results.extend(dispatcher.submit(frame_index, band))
+        results.extend(dispatcher.flush())
+    finally:
+        video_capture.release()
+
+    boxes = []  # 文本框在整帧中的 (上, 下, 左, 右)
+    subtitle_frames = []  # 有文本框通过过滤的帧序号
+    for frame_index, bottom_result in results:
+        filtered_result, _ = filter_by_font_size_and_confidence(bottom_result, frame_height)
+        if filtered_result:
+            subtitle_frames.append(frame_index)
+        for word_info in filtered_result:
+            xs = [point[0] for point in word_info[0]]
+            ys = [point[1] for point in word_info[0]]
+            boxes.append((min(ys) + default_top, max(ys) + default_top, min(xs) + default_left, max(xs) + default_left))
+    if len(boxes) < ROI_MIN_BOXES:
+        print(f"字幕区域标定: 有效文本框仅 {len(boxes)} 个，沿用默认裁剪范围")
+        return None
+
+    boxes = np.array(boxes, dtype=np.float64)
+    line_height = float(np.median(boxes[:, 1] - boxes[:, 0]))
+    margin = ROI_MARGIN * line_height
+    # 收紧后的范围不超出默认裁剪范围
+    crop_box = (max(int(boxes[:, 0].min() - margin), default_top), min(int(np.ceil(boxes[:, 1].max() + margin)), default_bottom),
+                max(int(boxes[:, 2].min() - margin), default_left), min(int(np.ceil(boxes[:, 3].max() + margin)), default_right))
+
+    centers = (boxes[:, 0] + boxes[:, 1]) / 2
+    center = float(np.median(centers))
+    line_box = None
+    text_rows = None
+    if np.max(np.abs(centers - center)) <= ROI_STABLE_TOLERANCE * line_height:
+        # 文本框横跨整条字幕条，高度取行高中位数；它总能通过字号过滤，字号由识别时按 text_rows 复检
+        band_width = float(crop_box[3] - crop_box[2])
+        y0, y1 = center - line_height / 2 - crop_box[0], center + line_height / 2 - crop_box[0]
+        line_box = [[0.0, y0], [band_width, y0], [band_width, y1], [0.0, y1]]
+        spans = [text_row_span(row_energies[i][crop_box[0] - default_top:crop_box[1] - default_top]) for i in subtitle_frames]
+        text_rows = [min(spans), max(spans)]
+
+    default_pixels = (default_bottom - default_top) * (default_right - default_left)
+    roi_pixels = (crop_box[1] - crop_box[0]) * (crop_box[3] - crop_box[2])
+    print(f"字幕区域标定: 抽样 {sample_count} 帧, 有效文本框 {len(boxes)} 个, 裁剪范围 {crop_box}, "
+          f"像素数 {roi_pixels}/{default_pixels} ({roi_pixels / default_pixels:.0%}), 行位置{'稳定' if line_box else '不稳定'}")
+    return {'crop_box': crop_box, 'line_box': line_box, 'text_rows': text_rows}
+
+def roi_path(video_path):
+    return os.path.join(CHECKPOINT_DIR, f'{os.path.splitext(os.path.basename(video_path))[0]}.roi.json')
+
+def locate_subtitle_roi(video_path, video_info, dispatcher, ocr_engine):
+    """返回本视频使用的裁剪范围，并按标定结果设置调度器的识别模式。
+    已有同一源文件的标定结果时直接沿用，保证断点续跑前后的字幕条与缓存键一致；需要标定时使用本视频独占的 ocr_engine"""
+    crop_box = subtitle_crop_box(video_info['height'], video_info['width'])
+    if not ROI_CALIBRATION_ENABLED:
+        return crop_box
+
+    path = roi_path(video_path)
+    source = video_source_signature(video_path)
+    calibration = None
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                calibration = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"标定结果读取失败，将重新标定: {path}, 错误: {e}")
+        if calibration and calibration.get('source') != source:
+            calibration = None
+    if calibration is None:
+        calibration = {'source': source, 'roi': calibrate_subtitle_roi(video_path, video_info, ocr_engine)}
+        os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(calibration, f)
+        os.replace(path + '.tmp', path)
+
+    roi = calibration['roi']
+    if roi is None:
+        return crop_box
+    # 旧版本的标定结果没有 text_rows，无法复检字号，此时仍用检测+识别
+    if REC_ONLY_ENABLED and roi['line_box'] is not None and roi.get('text_rows'):
+        dispatcher.line_box = roi['line_box']
+        dispatcher.text_rows = roi['text_rows']
+    return tuple(roi['crop_box'])
+
+def ocr_result_text(bottom_result, frame_height):
+    """过滤单帧OCR结果并拼接为规范化文本，返回 (过滤后的结果, 置信度列表, 文本)"""
+    filtered_result, frame_confidences = filter_by_font_size_and_confidence(bottom_result, frame_height)
+    current_text = ""
+    if filtered_result:
+        try:
+            current_text = ''.join([normalize_text(word[1][0]) for word in filtered_result])
+        except Exception as e:
+            print(f"Error processing OCR result: {e}")
+            current_text = ""
+
+        if len(current_text) < MIN_TEXT_LENGTH:
+            current_text = ""
+    return filtered_result, frame_confidences, current_text
+
+class SubtitleTracker:
+    """字幕状态机：按时间顺序接收每个采样帧的OCR结果，生成 (开始, 结束, 文本) 元组"""
+
+    def __init__(self, frame_height):
+        self.frame_height = frame_height
+        self.subtitles = []
+        self.confidence_scores = []
+        self.last_text = ""
+        self.start_timestamp = None
+
+    def state(self):
+        """可写入检查点的状态"""
+        return {
+            'subtitles': self.subtitles,
+            'confidence_scores': self.confidence_scores,
+            'last_text': self.last_text,
+            'start_timestamp': self.start_timestamp,
+        }
+
+    def restore(self, state):
+        self.subtitles = [tuple(subtitle) for subtitle in state['subtitles']]
+        self.confidence_scores = state['confidence_scores']
+        self.last_text = state['last_text']
+        self.start_timestamp = state['start_timestamp']
+
+    def feed(self, timestamp, bottom_result):
+        filtered_result, frame_confidences, current_text = ocr_result_text(bottom_result, self.frame_height)
+
+        self.confidence_scores.extend(frame_confidences)
+
+        if filtered_result:
+            if self.last_text == "" and current_text:
+                self.start_timestamp = timestamp
+
+            if current_text:
+                self.subtitles.append((self.start_timestamp, timestamp, current_text))
+
+            self.last_text = current_text
+        else:
+            if self.last_text:
+                self.subtitles.append((self.start_timestamp, timestamp, self.last_text))
+                self.last_text = ""
+
+def video_source_signature(video_path):
+    """视频文件的大小与修改时间，用于判断源文件是否变化"""
+    stat = os.stat(video_path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def checkpoint_path(video_path):
+    return os.path.join(CHECKPOINT_DIR, f'{os.path.splitext(os.path.basename(video_path))[0]}.checkpoint.json')
 
-            pbar.update(1)
+def load_checkpoint(video_path):
+    """读取检查点，源视频已变化或检查点不存在时返回 None"""
+    path = checkpoint_path(video_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"检查点读取失败，将重新提取: {path}, 错误: {e}")
+        return None
+    if checkpoint.get('source') != video_source_signature(video_path):
+        return None
+    return checkpoint
 
-        frame_index += 1
+def save_checkpoint(video_path, frame_index, tracker, dispatcher, complete=False):
+    """原子地写入检查点：已处理到的帧序号、字幕状态机状态与逐帧缓存键记录"""
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    checkpoint = {
+        'video': video_path,
+        'source': video_source_signature(video_path),
+        'frame_index': frame_index,
+        'tracker': tracker.state(),
+        'frame_log': dispatcher.frame_log,
+        'complete': complete,
+    }
+    path = checkpoint_path(video_path)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f, ensure_ascii=False)
+    os.replace(path + '.tmp', path)
+
+def resume_from_checkpoint(video_path, tracker, dispatcher, frame_interval):
+    """有未完成的检查点时恢复状态，返回继续处理的起始帧序号"""
+    checkpoint = load_checkpoint(video_path)
+    if checkpoint is None or checkpoint['complete']:
+        return 0
+    tracker.restore(checkpoint['tracker'])
+    dispatcher.frame_log = [tuple(entry) for entry in checkpoint['frame_log']]
+    print(f"从检查点恢复: 已处理到第 {checkpoint['frame_index']} 帧")
+    return checkpoint['frame_index'] + frame_interval
+
+def reached_end_of_video(video_info, sampling_stats, frame_interval):
+    """帧来源是否读到了视频末尾；解码提前停止（文件截断、读取失败）时返回 False"""
+    total_frames = video_info['total_frames']
+    position = sampling_stats.get('position', 0)
+    if total_frames <= 0:
+        # 容器没有给出总帧数，只能确认至少读到了帧
+        return sampling_stats.get('sampled', 0) > 0
+    tolerance = max(int(video_info['fps'] * END_OF_VIDEO_TOLERANCE), frame_interval)
+    if position + tolerance >= total_frames:
+        return True
+    print(f"解码在第 {position} 帧停止，视频共 {total_frames} 帧，未读到末尾，不标记为已完成")
+    return False
+
+def is_extraction_complete(video_path, ass_output_path):
+    """ASS文件已生成且对应的源视频未变化"""
+    if not os.path.exists(ass_output_path):
+        return False
+    checkpoint = load_checkpoint(video_path)
+    return bool(checkpoint and checkpoint['complete'])
+
+def extract_subtitles(video_path, ass_output_path, ocr_engine=None):
+    """从视频中提取字幕并生成ASS文件；并行处理多个视频时需传入本视频独占的 ocr_engine"""
+    video_info = read_video_info(video_path)
+    total_frames = video_info['total_frames']
+    frame_height = video_info['height']
+    
+    frame_interval = int(video_info['fps']) // FRAME_RATE
+    
+    tracker = SubtitleTracker(frame_height)
+    dispatcher = OcrDispatcher(ocr_engine or default_ocr_engine())
+    crop_box = locate_subtitle_roi(video_path, video_info, dispatcher, dispatcher.ocr_engine)
+
+    start_frame = resume_from_checkpoint(video_path, tracker, dispatcher, frame_interval)
+
+    pbar = tqdm(total=total_frames // frame_interval, initial=start_frame // frame_interval,
+                desc="Processing frames", unit="frame")
+    sampling_stats = {}
+    sampling_start = time.perf_counter()
+    last_checkpoint = sampling_start
+    frames, source_crop_box = open_frame_source(video_path, video_info, frame_interval, crop_box, sampling_stats,
+                                                start_frame=start_frame)
+
+    for frame_index, timestamp, frame in frames:
+        # 增强并裁剪出字幕条
+        cropped_frame = preprocess_frame(frame, source_crop_box)
+
+        ready_frames = dispatcher.submit(timestamp, cropped_frame)
+        for ready_timestamp, bottom_result in ready_frames:
+            tracker.feed(ready_timestamp, bottom_result)
+
+        # 批次刚刚清空时，状态机恰好处理到当前帧，可以安全地写检查点
+        if ready_frames and not dispatcher.pending_frames and time.perf_counter() - last_checkpoint > CHECKPOINT_INTERVAL:
+            save_checkpoint(video_path, frame_index, tracker, dispatcher)
+            last_checkpoint = time.perf_counter()
+
+        pbar.update(1)
+
+    for ready_timestamp, bottom_result in dispatcher.flush():
+        tracker.feed(ready_timestamp, bottom_result)
 
     pbar.close()
+    save_frame_log(video_path, frame_height, dispatcher.frame_log)
+    finish_extraction(tracker, dispatcher, sampling_stats, time.perf_counter() - sampling_start, ass_output_path)
+    # 没有读到末尾时保留上一个检查点，下次从那里继续
+    if reached_end_of_video(video_info, sampling_stats, frame_interval):
+        save_checkpoint(video_path, total_frames, tracker, dispatcher, complete=True)
+
+def extract_subtitles_pipelined(video_path, ass_output_path, preprocess_workers=PREPROCESS_WORKERS, ocr_workers=OCR_WORKERS,
+                                ocr_engines=None):
+    """流水线版本的字幕提取：解码线程经有界队列把帧交给预处理线程池，按帧顺序做变化检测与凑批后
+    分发给多个OCR工作线程，结果按批次序号重排后再进入字幕状态机。
+
+    ocr_engines 为每个OCR工作线程各一个的PaddleOCR实例，处理多集时可传入同一组实例跨集复用
+    （函数返回前所有工作线程都已结束），不传则为本视频新建 ocr_workers 个。"""
+    video_info = read_video_info(video_path)
+    total_frames = video_info['total_frames']
+    frame_height = video_info['height']
+
+    frame_interval = int(video_info['fps']) // FRAME_RATE
+
+    tracker = SubtitleTracker(frame_height)
+    dispatcher = OcrDispatcher(None)
+    # 每个OCR工作线程一个PaddleOCR实例，标定时借用第一个；同一时刻不与其他视频共享
+    if ocr_engines is None:
+        ocr_engines = [create_ocr_engine() for _ in range(ocr_workers)]
+    ocr_workers = len(ocr_engines)
+    crop_box = locate_subtitle_roi(video_path, video_info, dispatcher, ocr_engines[0])
+
+    frame_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    job_queue = queue.Queue(maxsize=ocr_workers * 2)
+    result_queue = queue.Queue()
+    end_of_stream = object()
+    stop_event = threading.Event()  # 任一环节出错后通知其余线程尽快退出
+    sampling_stats = {}
+    # ffmpeg 来源的缓冲区要覆盖队列和预处理中可能同时存活的全部帧
+    buffer_count = PIPELINE_QUEUE_SIZE + preprocess_workers * 2 + 4
+    start_frame = resume_from_checkpoint(video_path, tracker, dispatcher, frame_interval)
+    frames, source_crop_box = open_frame_source(video_path, video_info, frame_interval, crop_box, sampling_stats,
+                                                buffer_count, start_frame)
+
+    def put_until_stopped(target_queue, item):
+        """有界队列满时等待，但在流水线中止后放弃写入，避免线程永久阻塞"""
+        while not stop_event.is_set():
+            try:
+                target_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get_until_stopped(source_queue):
+        """从队列取数据，流水线中止后返回 end_of_stream"""
+        while not stop_event.is_set():
+            try:
+                return source_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return end_of_stream
+
+    def decode():
+        try:
+            for frame_index, timestamp, frame in frames:
+                if not put_until_stopped(frame_queue, (frame_index, timestamp, frame)):
+                    break
+        except Exception as e:
+            result_queue.put(e)
+        finally:
+            frames.close()
+            put_until_stopped(frame_queue, end_of_stream)
+
+    def dispatch():
+        # 预处理结果按提交顺序取回，保证变化检测与凑批按帧顺序进行
+        job_id = 0
+        in_flight = deque()
+        try:
+            with ThreadPoolExecutor(max_workers=preprocess_workers) as pool:
+                while not stop_event.is_set():
+                    item = get_until_stopped(frame_queue)
+                    if item is not end_of_stream:
+                        frame_index, timestamp, frame = item
+                        in_flight.append((frame_index, timestamp, pool.submit(preprocess_frame, frame, source_crop_box)))
+                    # 队首已完成或者积压过多时按顺序取回
+                    while in_flight and (item is end_of_stream or in_flight[0][2].done()
+                                         or len(in_flight) > preprocess_workers * 2):
+                        frame_index, timestamp, future = in_flight.popleft()
+                        job = dispatcher.plan(timestamp, future.result())
+                        if job:
+                            # 记录该批次覆盖到的最后一帧，用于写检查点
+                            job['last_frame_index'] = frame_index
+                            put_until_stopped(job_queue, (job_id, job))
+                            job_id += 1
+                    if item is end_of_stream:
+                        break
+            put_until_stopped(job_queue, (job_id, dispatcher.plan_flush()))
+        except Exception as e:
+            result_queue.put(e)
+        finally:
+            for _ in range(ocr_workers):
+                put_until_stopped(job_queue, end_of_stream)
+
+    def recognize(ocr_engine):
+        try:
+            while not stop_event.is_set():
+                item = get_until_stopped(job_queue)
+                if item is end_of_stream:
+                    break
+                job_id, job = item
+                result_queue.put((job_id, job, dispatcher.run_job(job, ocr_engine)))
+        except Exception as e:
+            result_queue.put(e)
+        finally:
+            result_queue.put(end_of_stream)
+
+    pbar = tqdm(total=total_frames // frame_interval, initial=start_frame // frame_interval,
+                desc="Processing frames", unit="frame")
+    sampling_start = time.perf_counter()
+    last_checkpoint = sampling_start
+    threads = [threading.Thread(target=decode, daemon=True), threading.Thread(target=dispatch, daemon=True)]
+    threads += [threading.Thread(target=recognize, args=(ocr_engine,), daemon=True) for ocr_engine in ocr_engines]
+    for thread in threads:
+        thread.start()
+
+    # 按批次序号重排，保证状态机按时间顺序接收
+    next_job_id = 0
+    reorder_buffer = {}
+    finished_workers = 0
+    try:
+        while finished_workers < ocr_workers:
+            item = result_queue.get()
+            if item is end_of_stream:
+                finished_workers += 1
+                continue
+            if isinstance(item, Exception):
+                raise item
+            job_id, job, results = item
+            reorder_buffer[job_id] = (job, results)
+            while next_job_id in reorder_buffer:
+                job, results = reorder_buffer.pop(next_job_id)
+                for ready_timestamp, bottom_result in dispatcher.resolve(job, results):
+                    tracker.feed(ready_timestamp, bottom_result)
+                pbar.update(len(job['frames']))
+                next_job_id += 1
+                if 'last_frame_index' in job and time.perf_counter() - last_checkpoint > CHECKPOINT_INTERVAL:
+                    save_checkpoint(video_path, job['last_frame_index'], tracker, dispatcher)
+                    last_checkpoint = time.perf_counter()
+
+        save_frame_log(video_path, frame_height, dispatcher.frame_log)
+        finish_extraction(tracker, dispatcher, sampling_stats, time.perf_counter() - sampling_start, ass_output_path)
+        # 没有读到末尾时保留上一个检查点，下次从那里继续
+        if reached_end_of_video(video_info, sampling_stats, frame_interval):
+            save_checkpoint(video_path, total_frames, tracker, dispatcher, complete=True)
+    finally:
+        # 无论正常结束还是主线程出错，都让解码、分发与OCR线程退出（解码线程退出时关闭 ffmpeg 子进程），
+        # 并等待它们结束，出错的视频不会留下仍占着PaddleOCR实例的线程
+        stop_event.set()
+        for thread in threads:
+            thread.join()
+        pbar.close()
+
+def same_subtitle_line(text1, text2):
+    """判断两次识别是否为同一条字幕（容忍OCR的细微抖动）"""
+    if text1 == text2:
+        return True
+    return bool(text1 and text2) and similar(text1, text2) > SIMILARITY_THRESHOLD
+
+def extract_subtitles_adaptive(video_path, ass_output_path, ocr_engine=None):
+    """粗到细提取字幕：先按 COARSE_FRAME_RATE 稀疏采样识别，再只在相邻采样文本不同的区间内
+    定位帧并二分，把每条字幕的起止时间精确到帧，输出与其他模式相同的 (开始, 结束, 文本) 元组。
+
+    二分阶段在每个区间内从左侧采样开始顺序 grab，只对二分用到的帧做OCR；区间之间相距较远时按帧号定位，
+    容器索引不准确的视频上精度会受影响。并行处理多个视频时需传入本视频独占的 ocr_engine。
+    """
+    video_info = read_video_info(video_path)
+    fps = video_info['fps']
+    frame_height = video_info['height']
+    coarse_interval = max(int(fps) // COARSE_FRAME_RATE, 1)
+
+    frame_texts = {}  # 帧序号 -> 识别出的文本
+    confidence_scores = []
+    search_start = time.perf_counter()
+    # 二分得到的边界无法由逐帧记录重放，删除之前逐帧或流水线模式留下的记录，避免重建时用到旧结果
+    remove_frame_log(video_path)
+
+    # 第一遍：稀疏采样，变化检测与凑批照常生效；这里用帧序号代替时间戳在调度器中流转
+    dispatcher = OcrDispatcher(ocr_engine or default_ocr_engine())
+    crop_box = locate_subtitle_roi(video_path, video_info, dispatcher, dispatcher.ocr_engine)
+    sampling_stats = {}
+    frames, source_crop_box = open_frame_source(video_path, video_info, coarse_interval, crop_box, sampling_stats)
+    coarse_results = []
+    for frame_index, _, frame in frames:
+        coarse_results.extend(dispatcher.submit(frame_index, preprocess_frame(frame, source_crop_box)))
+    coarse_results.extend(dispatcher.flush())
+    for frame_index, bottom_result in coarse_results:
+        _, frame_confidences, frame_texts[frame_index] = ocr_result_text(bottom_result, frame_height)
+        confidence_scores.extend(frame_confidences)
+    coarse_indices = sorted(frame_texts)
+
+    # 第二遍：只在文本发生变化的相邻采样之间二分。区间内的帧按顺序 grab，每帧只保留扩展裁剪范围内未增强的字幕条，
+    # 二分会回头查看左半区间，因此区间内的帧都要 retrieve，但只有二分用到的帧才增强并OCR
+    video_capture = cv2.VideoCapture(video_path)
+    expanded_box, inner_box = expand_crop_box(crop_box, frame_height, video_info['width'])
+    refine_stats = {'decoded': 0, 'seeks': 0}
+    interval_bands = {}  # 当前区间内各帧序号 -> 字幕条
+    position = 0  # 下一次 grab 得到的帧序号
+
+    def load_interval(low, high):
+        """顺序读入 (low, high) 内各帧的字幕条，每个 grab 的帧都计入解码帧数"""
+        nonlocal position
+        if low + 1 - position > REFINE_SEEK_GAP:
+            video_capture.set(cv2.CAP_PROP_POS_FRAMES, low + 1)
+            refine_stats['seeks'] += 1
+            position = low + 1
+        interval_bands.clear()
+        top, bottom, left, right = expanded_box
+        while position < high:
+            if not video_capture.grab():
+                break
+            refine_stats['decoded'] += 1
+            if position > low:
+                ret, frame = video_capture.retrieve()
+                if ret:
+                    interval_bands[position] = frame[top:bottom, left:right].copy()
+            position += 1
+
+    def text_at(frame_index):
+        if frame_index not in frame_texts:
+            band = interval_bands.get(frame_index)
+            if band is None:
+                frame_texts[frame_index] = ""
+            else:
+                bottom_result = dispatcher.run_job({'bands': [preprocess_frame(band, inner_box)]})[0]
+                _, frame_confidences, frame_texts[frame_index] = ocr_result_text(bottom_result, frame_height)
+                confidence_scores.extend(frame_confidences)
+        return frame_texts[frame_index]
+
+    def find_changes(low, low_text, high, high_text):
+        """返回 (low, high] 区间内每次文本变化的 (首帧序号, 新文本)"""
+        if high - low <= 1:
+            return [(high, high_text)]
+        middle = (low + high) // 2
+        middle_text = text_at(middle)
+        if same_subtitle_line(middle_text, low_text):
+            return find_changes(middle, middle_text, high, high_text)
+        if same_subtitle_line(middle_text, high_text):
+            return find_changes(low, low_text, middle, middle_text)
+        # 区间内出现了第三条字幕，两侧分别继续查找
+        return find_changes(low, low_text, middle, middle_text) + find_changes(middle, middle_text, high, high_text)
+
+    change_points = [(coarse_indices[0], frame_texts[coarse_indices[0]])] if coarse_indices else []
+    for low, high in zip(coarse_indices, coarse_indices[1:]):
+        if not same_subtitle_line(frame_texts[low], frame_texts[high]):
+            load_interval(low, high)
+            change_points.extend(find_changes(low, frame_texts[low], high, frame_texts[high]))
     video_capture.release()
-    generate_ass(subtitles, ass_output_path)
+
+    # 相邻变化点之间为一条字幕，文本取该区间内识别到的最长结果
+    subtitles = []
+    segment_ends = [frame_index for frame_index, _ in change_points[1:]] + [coarse_indices[-1] if coarse_indices else 0]
+    for (start_index, text), end_index in zip(change_points, segment_ends):
+        if not text:
+            continue
+        segment_texts = [t for i, t in frame_texts.items() if start_index <= i < end_index and t]
+        subtitles.append((start_index / fps, end_index / fps, max(segment_texts or [text], key=len)))
+
+    elapsed = time.perf_counter() - search_start
+    print(f"粗采样帧数: {len(coarse_indices)}, 二分阶段解码帧数: {refine_stats['decoded']}, "
+          f"按帧号定位: {refine_stats['seeks']} 次, OCR字幕条: {dispatcher.stats['bands']}, 耗时: {elapsed:.1f}s")
+    tracker = SubtitleTracker(frame_height)
+    tracker.subtitles = subtitles
+    tracker.confidence_scores = confidence_scores
+    finish_extraction(tracker, dispatcher, sampling_stats, elapsed, ass_output_path)
+    if reached_end_of_video(video_info, sampling_stats, coarse_interval):
+        save_checkpoint(video_path, video_info['total_frames'], tracker, dispatcher, complete=True)
+
+def finish_extraction(tracker, dispatcher, sampling_stats, elapsed, ass_output_path):
+    """打印抽帧与OCR统计，生成ASS文件并汇总置信度"""
+    report_sampling_stats(sampling_stats, elapsed)
+    dispatcher.report(sampling_stats.get('sampled', 0))
+    generate_ass(tracker.subtitles, ass_output_path)
     
     # 计算并打印置信度信息
+    confidence_scores = tracker.confidence_scores
     if confidence_scores:
         min_conf = np.min(confidence_scores)
         max_conf = np.max(confidence_scores)
@@ -181,6 +1205,155 @@ def extract_subtitles(video_path, ass_output_path):
     else:
         print("没有置信度数据")
 
+def benchmark_ocr_batch_sizes(video_path, batch_sizes=(1, 2, 4, 8, 12), max_frames=600):
+    """在同一批字幕条上比较不同OCR批大小的吞吐量（关闭变化检测与OCR缓存，保证每个批大小下每条都送去识别）"""
+    global CHANGE_GATE_ENABLED, OCR_CACHE_ENABLED
+    video_capture = cv2.VideoCapture(video_path)
+    fps = int(video_capture.get(cv2.CAP_PROP_FPS))
+    frame_width = int(video_capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+    frame_height = int(video_capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    frame_interval = max(fps // FRAME_RATE, 1)
+
+    crop_box = subtitle_crop_box(frame_height, frame_width)
+
+    bands = []
+    for _, timestamp, frame in iter_sampled_frames(video_capture, frame_interval):
+        bands.append((timestamp, preprocess_frame(frame, crop_box)))
+        if len(bands) >= max_frames:
+            break
+    video_capture.release()
+
+    gate_enabled, cache_enabled = CHANGE_GATE_ENABLED, OCR_CACHE_ENABLED
+    CHANGE_GATE_ENABLED = OCR_CACHE_ENABLED = False
+    try:
+        for batch_size in batch_sizes:
+            dispatcher = OcrDispatcher(default_ocr_engine(), batch_size)
+            for timestamp, band in bands:
+                dispatcher.submit(timestamp, band)
+            dispatcher.flush()
+            dispatcher.report(len(bands))
+    finally:
+        CHANGE_GATE_ENABLED, OCR_CACHE_ENABLED = gate_enabled, cache_enabled
+
+def verify_change_gate(video_path, max_frames=3000, ocr_engine=None):
+    """逐帧OCR（不复用结果），统计变化检测判为未变化、但文本与上一次识别的字幕条不同的帧（漏检）"""
+    ocr_engine = ocr_engine or default_ocr_engine()
+    video_capture = cv2.VideoCapture(video_path)
+    fps = int(video_capture.get(cv2.CAP_PROP_FPS))
+    frame_width = int(video_capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+    frame_height = int(video_capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    frame_interval = max(fps // FRAME_RATE, 1)
+    crop_box = subtitle_crop_box(frame_height, frame_width)
+
+    anchor_signature, anchor_text = None, None
+    gated, missed = 0, []
+    for frame_index, timestamp, frame in iter_sampled_frames(video_capture, frame_interval):
+        if frame_index >= max_frames:
+            break
+        band = preprocess_frame(frame, crop_box)
+        _, _, text = ocr_result_text(ocr_engine.ocr(band), frame_height)
+        signature = band_signature(band)
+        if band_changed(anchor_signature, signature):
+            anchor_signature, anchor_text = signature, text
+            continue
+        gated += 1
+        if text != anchor_text:
+            missed.append((timestamp, anchor_text, text))
+    video_capture.release()
+
+    print(f"变化检测复用 {gated} 帧，其中文本不同（漏检） {len(missed)} 帧")
+    for timestamp, anchor_text, text in missed[:20]:
+        print(f"  {format_ass_time(timestamp)}: {anchor_text!r} -> {text!r}")
+    return missed
+
+def format_ass_time(seconds):
+    """秒数转换为 ASS 时间格式 H:MM:SS.cc"""
+    return f"{time.strftime('%H:%M:%S', time.gmtime(seconds))}.{int((seconds % 1) * 100):02d}"
+
+def merge_subtitles(subtitles):
+    """与原始逐条合并逻辑决策一致的快速合并（原始逻辑保留在 tests/test_merge_subtitles.py 中作为参照）：
+    - 两段文本都非空时三个合并条件都不会抛异常，先判断最便宜的时间间隔条件
+      （密集采样时同一条字幕的元组开始时间相同，间隔为负，绝大多数在这里直接合并）；
+    - 每种文本的字符集合与字符计数只计算一次；
+    - 相似度先用长度上界和字符计数上界（即 SequenceMatcher 的 real_quick_ratio / quick_ratio）判断，
+      上界不超过阈值时真实相似度也不可能超过，只有剩余情况才运行 SequenceMatcher，且相同文本对只算一次。
+    相似度仍采用 SequenceMatcher.ratio()，换成其他编辑距离会改变合并结果。
+    """
+    profiles = {}
+    ratios = {}
+
+    def profile(text):
+        if text not in profiles:
+            profiles[text] = (set(text), Counter(text))
+        return profiles[text]
+
+    def exceeds_similarity(a, b):
+        if a == b:
+            return 1.0 > SIMILARITY_THRESHOLD
+        length = len(a) + len(b)
+        if 2.0 * min(len(a), len(b)) / length <= SIMILARITY_THRESHOLD:
+            return False
+        counts_a, counts_b = profile(a)[1], profile(b)[1]
+        if len(counts_a) > len(counts_b):
+            counts_a, counts_b = counts_b, counts_a
+        matches = sum(min(count, counts_b[char]) for char, count in counts_a.items() if char in counts_b)
+        if 2.0 * matches / length <= SIMILARITY_THRESHOLD:
+            return False
+        if (a, b) not in ratios:
+            ratios[(a, b)] = similar(a, b)
+        return ratios[(a, b)] > SIMILARITY_THRESHOLD
+
+    def subset_match(text1, text2):
+        set1, set2 = profile(text1)[0], profile(text2)[0]
+        common_length = len(set1 & set2)
+        return (SUBSET_MIN_THRESHOLD <= common_length / len(set1) <= SUBSET_MAX_THRESHOLD or 
+                SUBSET_MIN_THRESHOLD <= common_length / len(set2) <= SUBSET_MAX_THRESHOLD)
+
+    def overlap(a, b):
+        if a is None or b is None:
+            return 0, max(len(a or ""), len(b or ""))
+        a_set, b_set = profile(a)[0], profile(b)[0]
+        intersection_len = len(a_set & b_set)
+        union_len = len(a_set) + len(b_set) - intersection_len
+        return intersection_len / max(len(a_set), len(b_set)), union_len - intersection_len
+
+    merged = []
+    previous_text = None
+    previous_start_time = None
+    previous_end_time = None
+
+    for start_time, end_time, text in subtitles:
+        time_difference = start_time - previous_end_time if previous_end_time is not None else None
+
+        if previous_text and text and time_difference is not None and time_difference < 0.45:
+            previous_end_time = end_time
+            if len(text) > len(previous_text):
+                previous_text = text
+        elif previous_text and (
+            exceeds_similarity(previous_text, text) or
+            subset_match(previous_text, text) or
+            (time_difference is not None and time_difference < 0.45)
+        ):
+            previous_end_time = end_time
+            if len(text) > len(previous_text):
+                previous_text = text
+        else:
+            overlap_ratio, non_overlap_len = overlap(previous_text, text)
+            if PARTIAL_OVERLAP_THRESHOLD <= overlap_ratio <= SIMILARITY_THRESHOLD and non_overlap_len < 5:
+                previous_end_time = end_time
+                if len(text) > len(previous_text):
+                    previous_text = text
+            else:
+                if previous_text is not None:
+                    merged.append((previous_start_time, previous_end_time, previous_text))
+                previous_text = text
+                previous_start_time = start_time
+                previous_end_time = end_time
+
+    if previous_text is not None:
+        merged.append((previous_start_time, previous_end_time, previous_text))
+    return merged
+
 def generate_ass(subtitles, output_path):
     """生成ASS字幕文件，去重并合并相似的字幕，保留最长文本"""
     with open(output_path, 'w', encoding='utf-8') as f:
@@ -196,55 +1369,11 @@ def generate_ass(subtitles, output_path):
         f.write('[Events]\n')
         f.write('Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text\n')
 
-        previous_text = None
-        previous_start_time = None
-        previous_end_time = None
-
-        for start_time, end_time, text in subtitles:
-            # 检查时间间隔是否小于 00:00:00.45
-            time_difference = start_time - previous_end_time if previous_end_time is not None else None
+        for start_time, end_time, text in merge_subtitles(subtitles):
+            f.write(f'Dialogue: 0,{format_ass_time(start_time)},{format_ass_time(end_time)},Default,,0,0,0,,{text}\n')
 
-            # 检查相似度或子集匹配，或时间间隔小于 00:00:00.45
-            if previous_text and (
-                similar(previous_text, text) > SIMILARITY_THRESHOLD or 
-                is_subset(previous_text, text) or 
-                (time_difference is not None and time_difference < 0.45)
-            ):
-                previous_end_time = end_time
-                # 保留最长的文本
-                if len(text) > len(previous_text):
-                    previous_text = text
-
-            # 补集判断逻辑
-            else:
-                overlap_ratio, non_overlap_len = partial_overlap(previous_text, text)
-                if PARTIAL_OVERLAP_THRESHOLD <= overlap_ratio <= SIMILARITY_THRESHOLD and non_overlap_len < 5:
-                    previous_end_time = end_time
-                    if len(text) > len(previous_text):
-                        previous_text = text
-                else:
-                    # 如果有前一个字幕，先将其写入文件
-                    if previous_text is not None:
-                        start_time_str = f"{time.strftime('%H:%M:%S', time.gmtime(previous_start_time))}.{int((previous_start_time % 1) * 100):02d}"
-                        end_time_str = f"{time.strftime('%H:%M:%S', time.gmtime(previous_end_time))}.{int((previous_end_time % 1) * 100):02d}"
-                        f.write(f'Dialogue: 0,{start_time_str},{end_time_str},Default,,0,0,0,,{previous_text}\n')
-
-                    # 更新为当前字幕
-                    previous_text = text
-                    previous_start_time = start_time
-                    previous_end_time = end_time
-
-        # 写入最后一条字幕
-        if previous_text is not None:
-            start_time_str = f"{time.strftime('%H:%M:%S', time.gmtime(previous_start_time))}.{int((previous_start_time % 1) * 100):02d}"
-            end_time_str = f"{time.strftime('%H:%M:%S', time.gmtime(previous_end_time))}.{int((previous_end_time % 1) * 100):02d}"
-            f.write(f'Dialogue: 0,{start_time_str},{end_time_str},Default,,0,0,0,,{previous_text}\n')
-
-
-
-
-def process_videos():
-    """处理视频目录中的所有视频文件"""
+def process_videos(max_parallel_videos=MAX_PARALLEL_VIDEOS, worker_budget=WORKER_BUDGET):
+    """处理视频目录中的所有视频文件，可在全局工作线程预算内同时处理多集"""
     
     # 通过正则表达式从文件名中提取数字，并使用自然顺序进行排序
     def natural_sort_key(filename):
@@ -253,12 +1382,56 @@ def process_videos():
     # 对目录中的文件进行自然排序
     flv_files = sorted([f for f in os.listdir(video_files_set) if f.endswith('.flv')], key=natural_sort_key)
 
-    # 遍历排序后的文件
-    for filename in flv_files:
+    # 每集分到的线程：1 个解码、1 个分发、OCR工作线程，其余用于预处理
+    per_video_budget = max(worker_budget // max_parallel_videos, 1)
+    ocr_workers = max(min(OCR_WORKERS, per_video_budget - 2), 1)
+    preprocess_workers = max(per_video_budget - ocr_workers - 2, 1)
+
+    # 每个处理线程各持有自己的PaddleOCR实例，处理下一集时复用，并行的视频之间不共享：
+    # 非流水线模式（逐帧、粗到细）一个，流水线模式每个OCR工作线程一个
+    thread_engines = threading.local()
+
+    def episode_ocr_engine():
+        if max_parallel_videos <= 1:
+            return default_ocr_engine()
+        if not hasattr(thread_engines, 'engine'):
+            thread_engines.engine = create_ocr_engine()
+        return thread_engines.engine
+
+    def episode_pipeline_engines():
+        if not hasattr(thread_engines, 'pipeline_engines'):
+            thread_engines.pipeline_engines = [create_ocr_engine() for _ in range(ocr_workers)]
+        return thread_engines.pipeline_engines
+
+    def process_one(filename):
         video_path = os.path.join(video_files_set, filename)
         ass_output_path = os.path.join(ass_files_set, f'{os.path.splitext(filename)[0]}.ass')
+        if is_extraction_complete(video_path, ass_output_path):
+            print(f"Skipping video: {filename}, ASS already complete")
+            return
         print(f"Processing video: {filename}")
-        extract_subtitles(video_path, ass_output_path)
+        if ADAPTIVE_SEARCH_ENABLED:
+            extract_subtitles_adaptive(video_path, ass_output_path, episode_ocr_engine())
+        elif PIPELINE_ENABLED:
+            extract_subtitles_pipelined(video_path, ass_output_path, preprocess_workers, ocr_workers,
+                                        episode_pipeline_engines())
+        else:
+            extract_subtitles(video_path, ass_output_path, episode_ocr_engine())
+
+    if max_parallel_videos <= 1:
+        # 遍历排序后的文件
+        for filename in flv_files:
+            process_one(filename)
+        return
+
+    # 单集失败不影响其他集
+    with ThreadPoolExecutor(max_workers=max_parallel_videos) as executor:
+        futures = {executor.submit(process_one, filename): filename for filename in flv_files}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                print(f"处理视频失败: {futures[future]}, 错误: {e}")
 
 if __name__ == '__main__':
     process_videos()
@@ -1,61 +1,205 @@
 import os
+import sys
 import json
+import joblib
 import numpy as np
-from sklearn.cluster import KMeans
+from sklearn.cluster import MiniBatchKMeans
 from tqdm import tqdm
-import torch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import SpectrogramStore, NearestCentroidModel, pooled_spectrogram_features
 
 # 文件夹路径
 input_folder = './dataset/spectrograms'  # 输入文件夹，包含梅尔频谱图（.npy 格式）
+spectrogram_store_folder = './dataset/spectrogram_store'  # 打包存储，存在时优先从中读取
 output_json = './dataset/spectrogram_clusters.json'  # 输出：保存梅尔频谱图与类别号映射的 JSON 文件
 NUM_CLUSTERS = 5  # 假设有5个类别
 
-# 检查是否可以使用 GPU
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-print(f"Using device: {device}")
+# 每条片段的定长特征（与片段时长无关），在 CPU 上用 NumPy 计算：
+# 'band_stats' —— 每个梅尔频带在时间上的均值与标准差（2 × N_MELS 维）
+# 'mfcc_stats' —— 由对数梅尔频谱做 DCT 得到的前 N_MFCC 个倒谱系数的均值与标准差（2 × N_MFCC 维）
+FEATURE_MODE = 'band_stats'
+N_MFCC = 20
+# MiniBatchKMeans 每次 partial_fit 的片段数，内存只随该值和特征维数增长
+FIT_BATCH_SIZE = 1024
+
+# 聚类检查点：模型与已参与拟合的片段，每 CHECKPOINT_INTERVAL 批写一次，中断后从检查点继续。
+# 聚类完成后再次运行只为新增的片段分配已有的类别，不重新聚类；
+# 传入 --update 时先用新增片段继续 partial_fit 更新质心，传入 --refit 时丢弃检查点从头聚类
+checkpoint_path = './dataset/kmeans_checkpoint.joblib'
+CHECKPOINT_INTERVAL = 10
+# 最近质心模型（质心、标准化参数、类别编号），每次拟合后导出；重新聚类时与上一版对齐编号，
+# construct_*_json.py 用它直接填写 character
+model_path = './dataset/character_model.npz'
 
 # 提取频谱图数据
 def load_spectrogram(spectrogram_file):
-    """加载梅尔频谱图数据"""
-    spectrogram = np.load(spectrogram_file)
-    return torch.tensor(spectrogram, device=device)  # 将数据加载到 GPU 上（如果有 GPU）
+    """以内存映射方式加载梅尔频谱图数据"""
+    return np.load(spectrogram_file, mmap_mode='r')
+
+def iter_spectrograms():
+    """依次产出 (文件名, 频谱)；存在打包存储时按集内存映射读取，否则逐个加载 .npy"""
+    if os.path.isdir(spectrogram_store_folder):
+        store = SpectrogramStore(spectrogram_store_folder)
+        for shard in store.shards():
+            for key, spectrogram in store.items(shard):
+                yield f'{key}.npy', spectrogram
+        return
+    for spectrogram_file in sorted(os.listdir(input_folder)):
+        if spectrogram_file.endswith('.npy'):
+            yield spectrogram_file, load_spectrogram(os.path.join(input_folder, spectrogram_file))
+
+def extract_features(spectrogram, feature_mode=None):
+    """把 [声道, 梅尔频带, 帧] 的分贝频谱池化为定长特征向量；没有帧时返回 None"""
+    return pooled_spectrogram_features(spectrogram, feature_mode or FEATURE_MODE, N_MFCC)
+
+def iter_feature_batches(batch_size=FIT_BATCH_SIZE, skip=()):
+    """按批产出 (文件名列表, [批大小, 特征维数] 特征矩阵)，跳过 skip 中的文件"""
+    names, rows = [], []
+    for spectrogram_file, spectrogram in tqdm(iter_spectrograms()):
+        if spectrogram_file in skip:
+            continue
+        feature = extract_features(spectrogram)
+        if feature is None:
+            print(f"Skipping {spectrogram_file}, empty spectrogram.")
+            continue
+        names.append(spectrogram_file)
+        rows.append(feature)
+        if len(rows) == batch_size:
+            yield names, np.stack(rows)
+            names, rows = [], []
+    if rows:
+        yield names, np.stack(rows)
+
+def compute_feature_stats():
+    """分块遍历一次语料，累加得到特征的均值与标准差，用于标准化"""
+    count, total, total_sq = 0, 0.0, 0.0
+    for _, batch in iter_feature_batches():
+        batch = batch.astype(np.float64)
+        count += len(batch)
+        total = total + batch.sum(axis=0)
+        total_sq = total_sq + (batch * batch).sum(axis=0)
+    if count == 0:
+        return None, None
+    mean = total / count
+    std = np.sqrt(np.maximum(total_sq / count - mean * mean, 0))
+    # 几乎不变的维度不放大
+    return mean.astype(np.float32), np.where(std > 1e-6, std, 1.0).astype(np.float32)
+
+def load_checkpoint():
+    """读取检查点；不存在或特征、类别数设置已变化时返回新的检查点"""
+    if os.path.exists(checkpoint_path):
+        checkpoint = joblib.load(checkpoint_path)
+        if (checkpoint['feature_mode'] == FEATURE_MODE and checkpoint['num_clusters'] == NUM_CLUSTERS
+                and 'mean' in checkpoint):
+            return checkpoint
+        print("Checkpoint settings changed, clustering from scratch.")
+    return {
+        'kmeans': MiniBatchKMeans(n_clusters=NUM_CLUSTERS, random_state=42, batch_size=FIT_BATCH_SIZE),
+        'feature_mode': FEATURE_MODE,
+        'num_clusters': NUM_CLUSTERS,
+        'mean': None,  # 特征标准化参数，首次拟合前统计，之后固定
+        'scale': None,
+        'fitted': set(),  # 已参与拟合的片段
+        'complete': False,  # 是否已完整遍历过一次语料
+    }
+
+def save_checkpoint(checkpoint):
+    """先写临时文件再替换，避免中断时留下损坏的检查点"""
+    joblib.dump(checkpoint, checkpoint_path + '.tmp')
+    os.replace(checkpoint_path + '.tmp', checkpoint_path)
+
+def is_fitted(kmeans):
+    return hasattr(kmeans, 'cluster_centers_')
+
+def fit_streaming(checkpoint):
+    """分块遍历尚未拟合的片段并 partial_fit，定期写检查点；内存只与一批特征有关"""
+    kmeans = checkpoint['kmeans']
+    if checkpoint['mean'] is None:
+        print("Computing feature normalization statistics...")
+        checkpoint['mean'], checkpoint['scale'] = compute_feature_stats()
+        if checkpoint['mean'] is None:
+            return
+        save_checkpoint(checkpoint)
+    pending_names, pending = [], None
+    for batch_idx, (names, batch) in enumerate(iter_feature_batches(skip=checkpoint['fitted'])):
+        batch = (batch - checkpoint['mean']) / checkpoint['scale']
+        # 首次 partial_fit 需要至少 NUM_CLUSTERS 个样本，不足时并入下一批
+        if pending is not None:
+            names, batch = pending_names + names, np.concatenate([pending, batch])
+            pending_names, pending = [], None
+        if len(batch) < NUM_CLUSTERS and not is_fitted(kmeans):
+            pending_names, pending = names, batch
+            continue
+        kmeans.partial_fit(batch)
+        checkpoint['fitted'].update(names)
+        if (batch_idx + 1) % CHECKPOINT_INTERVAL == 0:
+            save_checkpoint(checkpoint)
+    checkpoint['complete'] = is_fitted(kmeans)
+    save_checkpoint(checkpoint)
+
+def export_model(checkpoint):
+    """由检查点导出最近质心模型；已有上一版模型时对齐类别编号"""
+    model = NearestCentroidModel(checkpoint['kmeans'].cluster_centers_, checkpoint['mean'], checkpoint['scale'],
+                                 feature_mode=FEATURE_MODE, n_mfcc=N_MFCC)
+    if os.path.exists(model_path):
+        previous = NearestCentroidModel.load(model_path)
+        if previous.feature_mode == model.feature_mode and previous.mean.shape == model.mean.shape:
+            model.match_labels(previous)
+    model.save(model_path)
+    return model
+
+def load_cluster_mapping():
+    if os.path.exists(output_json):
+        with open(output_json, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return {}
+
+def assign_clusters(model, cluster_mapping):
+    """分块为映射中尚没有类别的片段分配最近的已有类别"""
+    assigned = 0
+    for names, batch in iter_feature_batches(skip=cluster_mapping):
+        for name, label in zip(names, model.assign(batch)):
+            cluster_mapping[name] = int(label)
+        assigned += len(names)
+    return assigned
 
 # 聚类并保存结果
 def cluster_spectrograms():
-    spectrogram_files = [f for f in os.listdir(input_folder) if f.endswith('.npy')]
-    features = []
-    file_names = []
-
-    print("Loading spectrograms and extracting features...")
-    for spectrogram_file in tqdm(spectrogram_files):
-        spectrogram_path = os.path.join(input_folder, spectrogram_file)
-        
-        # 加载梅尔频谱图并转换为 GPU tensor
-        spectrogram = load_spectrogram(spectrogram_path)
-        
-        # 展平频谱图以作为聚类输入特征
-        flattened_spectrogram = spectrogram.flatten().cpu().numpy()  # 确保转回 CPU 进行 KMeans 聚类
-        features.append(flattened_spectrogram)
-        file_names.append(spectrogram_file)
-
-    # 将特征转换为 NumPy 数组
-    features = np.array(features)
-
-    # 使用 KMeans 进行聚类（在 CPU 上进行）
-    print(f"Clustering into {NUM_CLUSTERS} clusters...")
-    kmeans = KMeans(n_clusters=NUM_CLUSTERS, random_state=42).fit(features)
-
-    # 获取聚类标签
-    labels = kmeans.labels_
+    if '--refit' in sys.argv and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    checkpoint = load_checkpoint()
+
+    if not checkpoint['complete']:
+        # 首次聚类（或从中断处继续）：整个语料分块拟合，之后重新为所有片段分配类别
+        print(f"Extracting {FEATURE_MODE} features and clustering into {NUM_CLUSTERS} clusters...")
+        fit_streaming(checkpoint)
+        if not checkpoint['complete']:
+            print(f"Not enough spectrograms to form {NUM_CLUSTERS} clusters.")
+            return
+        model = export_model(checkpoint)
+        cluster_mapping = {}
+    else:
+        cluster_mapping = load_cluster_mapping()
+        if '--update' in sys.argv:
+            # 用新增片段继续更新质心，已分配的类别保持不变
+            print("Updating centroids with new spectrograms...")
+            fit_streaming(checkpoint)
+            model = export_model(checkpoint)
+        elif os.path.exists(model_path):
+            model = NearestCentroidModel.load(model_path)
+        else:
+            model = export_model(checkpoint)
+
+    print("Assigning spectrograms to clusters...")
+    assigned = assign_clusters(model, cluster_mapping)
+    print(f"Assigned {assigned} spectrograms.")
 
     # 将聚类结果保存到 JSON 文件
     print(f"Saving cluster mapping to {output_json} ...")
-    cluster_mapping = {}
-    for i, label in enumerate(labels):
-        cluster_mapping[file_names[i]] = int(label)
-
-    with open(output_json, 'w', encoding='utf-8') as f:
+    with open(output_json + '.tmp', 'w', encoding='utf-8') as f:
         json.dump(cluster_mapping, f, ensure_ascii=False, indent=4)
+    os.replace(output_json + '.tmp', output_json)
 
     print("Clustering complete. Cluster mapping saved.")
 
@@ -1,11 +1,22 @@
 import os
+import sys
+import json
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # 非交互后端，可在子进程中渲染
 import matplotlib.pyplot as plt
 import torch
 import torchaudio
-from torchaudio.transforms import MelSpectrogram, AmplitudeToDB
+import torch.nn.functional as F
+from torchaudio.transforms import MelSpectrogram, AmplitudeToDB, Resample
 from tqdm import tqdm
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils import SpectrogramStore, load_spectrogram_reference
+
 # 检查是否可以使用 GPU
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 print(f"Using device: {device}")
@@ -15,28 +26,105 @@ input_folder = './dataset/pure_audio'
 npy_output_folder = './dataset/spectrograms'
 png_output_folder = './dataset/spectrogram_images'
 
+# 频谱图像（.png）的渲染方式，在独立的进程池中进行，不阻塞 .npy 的生成：
+# 'none' —— 不渲染；'sample' —— 只渲染按文件名固定抽样的 PNG_SAMPLE_RATE 比例；'all' —— 全部渲染
+# 之后可运行 `python melspectrogram.py --render-png` 为已有的 .npy 补画图像
+RENDER_PNG = 'sample'
+PNG_SAMPLE_RATE = 0.02
+PNG_WORKERS = 2
+
+# 整集模式：对整集滤波后的音轨只计算一次梅尔频谱，再按字幕起止时间切出每条字幕的频谱，
+# 输出文件名与逐条模式相同；需要 extract_wav.py 开启 SAVE_EPISODE_AUDIO 并由 audio_filter.py 滤波整集音轨
+EPISODE_MEL_ENABLED = False
+episode_input_folder = './dataset/pure_episode_audio'  # 滤波后的整集音轨
+episode_segments_folder = './dataset/episode_audio'  # 每集的 <集名>.segments.json
+episode_npy_output_folder = './dataset/episode_spectrograms'  # 整集梅尔频谱，可按时间切片复用
+context_npy_output_folder = './dataset/context_spectrograms'  # 上下文窗口频谱
+# 每条字幕前后各取多少秒作为上下文窗口（供全局上下文模型使用），0 表示不生成
+CONTEXT_SECONDS = 0
+# 整集计算时每次 STFT 的帧数，避免一次性生成整集的复数频谱
+EPISODE_MEL_CHUNK_FRAMES = 4096
+
+# 打包存储：每集的全部字幕频谱顺序写入一个连续的数据文件（<集名>.bin + <集名>.index.json），
+# 以集名为分片、以原 .npy 文件名（不含扩展名）为键，读取时内存映射，代替数千个小 .npy 文件
+SPECTROGRAM_STORE_ENABLED = False
+spectrogram_store_folder = './dataset/spectrogram_store'
+SPECTROGRAM_STORE_DTYPE = 'float16'  # 'float32' 保留完整精度，体积翻倍
+
 # 创建输出文件夹（如果不存在）
 os.makedirs(npy_output_folder, exist_ok=True)
 os.makedirs(png_output_folder, exist_ok=True)
+spectrogram_store = SpectrogramStore(spectrogram_store_folder, SPECTROGRAM_STORE_DTYPE) if SPECTROGRAM_STORE_ENABLED else None
 
 # 音频处理参数
 SR = 22050  # 采样率
 N_MELS = 128  # 梅尔频率带数量
 HOP_LENGTH = 512  # 帧移长度
 WIN_LENGTH = 2048  # 窗口长度
+N_FFT = WIN_LENGTH  # FFT点数，不能小于窗口长度（默认的400会使 stft 报错）
 BATCH_SIZE = 32  # 批处理的大小，视显存而定
 
+# 加载时由解码器（torchaudio.io.StreamReader，需要 torchaudio 能找到 FFmpeg 库）直接输出 SR 采样率，不再单独重采样；
+# 关闭时按原采样率加载，再用按 (原采样率, SR) 缓存的 Resample 重采样
+DECODE_TO_TARGET_RATE = False
+
+# 批量计算：同一批的片段补零到相同长度后一次完成 STFT，再按各自的帧数裁剪（关闭时逐条计算，用于对比）
+BATCHED_MEL_ENABLED = True
+# 按时长排序后再分批，使同一批的片段长度接近，减少补零浪费
+BUCKET_BY_LENGTH = True
+# 单次 STFT 的采样点上限（行数 × 补齐后的长度）；CPU 上过大的批次超出缓存反而变慢，GPU 上可调大
+MEL_BATCH_SAMPLES = 1 << 18 if device.type == 'cpu' else 1 << 24
+
 # 定义MelSpectrogram的转换器
 mel_spectrogram_transform = MelSpectrogram(
     sample_rate=SR,
+    n_fft=N_FFT,
     n_mels=N_MELS,
     hop_length=HOP_LENGTH,
     win_length=WIN_LENGTH
 ).to(device)
 
+# 批量计算用的转换器：参数相同但不做居中填充，居中所需的反射填充按片段各自完成
+mel_spectrogram_transform_uncentered = MelSpectrogram(
+    sample_rate=SR,
+    n_fft=N_FFT,
+    n_mels=N_MELS,
+    hop_length=HOP_LENGTH,
+    win_length=WIN_LENGTH,
+    center=False
+).to(device)
+
 # 定义将功率谱转换为分贝
 amplitude_to_db = AmplitudeToDB().to(device)
 
+# 按 (原采样率, 目标采样率) 缓存的重采样器，整个运行期间复用同一组重采样卷积核
+resamplers = {}
+# 重采样累计耗时，计入梅尔频谱阶段并单独打印
+resample_stats = {'seconds': 0.0, 'waveforms': 0}
+
+def get_resampler(orig_freq, new_freq):
+    key = (orig_freq, new_freq)
+    if key not in resamplers:
+        resamplers[key] = Resample(orig_freq=orig_freq, new_freq=new_freq).to(device)
+    return resamplers[key]
+
+def load_audio(wav_path):
+    """加载音频，返回 ([声道, 采样点] 张量, 采样率)"""
+    if not DECODE_TO_TARGET_RATE:
+        return torchaudio.load(wav_path)
+    # torchaudio.io 依赖 FFmpeg 库，只在打开该选项时导入，不影响默认的加载方式
+    from torchaudio.io import StreamReader
+    reader = StreamReader(wav_path)
+    reader.add_basic_audio_stream(frames_per_chunk=-1, buffer_chunk_size=-1, sample_rate=SR)
+    reader.process_all_packets()
+    chunk, = reader.pop_chunks()
+    return chunk.t().contiguous(), SR
+
+def report_stage_seconds(stage_seconds):
+    print(f"加载: {stage_seconds['load']:.1f}s, 梅尔频谱: {stage_seconds['mel']:.1f}s "
+          f"(其中重采样 {resample_stats['waveforms']} 条: {resample_stats['seconds']:.1f}s, 重采样器 {len(resamplers)} 个), "
+          f"保存: {stage_seconds['save']:.1f}s")
+
 # 批量加载音频
 def batch_load_audio(wav_files, input_folder):
     """批量加载音频文件"""
@@ -44,13 +132,11 @@ def batch_load_audio(wav_files, input_folder):
     sample_rates = []
     for wav_file in wav_files:
         wav_path = os.path.join(input_folder, wav_file)
-        waveform, sr = torchaudio.load(wav_path)  # 加载音频文件
+        waveform, sr = load_audio(wav_path)  # 加载音频文件
         waveforms.append(waveform)
         sample_rates.append(sr)
-    
-    # 将所有音频文件拼接为一个大批次
-    waveforms = torch.cat(waveforms, dim=0)
-    
+
+    # 各片段长度不同，保持为 [声道, 采样点] 张量的列表，由 generate_mel_spectrograms_batched 补齐
     return waveforms, sample_rates
 
 # 使用 torchaudio 生成梅尔频谱图的函数
@@ -59,9 +145,7 @@ def generate_mel_spectrograms(waveforms, sample_rates):
     mel_spectrograms = []
     for i, waveform in enumerate(waveforms):
         # 如果采样率不一致，重采样到指定的 SR
-        if sample_rates[i] != SR:
-            resampler = torchaudio.transforms.Resample(orig_freq=sample_rates[i], new_freq=SR).to(device)
-            waveform = resampler(waveform)
+        waveform = resample_waveform(waveform, sample_rates[i])
 
         # 将波形移动到GPU并生成梅尔频谱图
         waveform = waveform.to(device)
@@ -71,61 +155,278 @@ def generate_mel_spectrograms(waveforms, sample_rates):
     
     return mel_spectrograms
 
-# 保存频谱图数据和可视化图像
-def save_spectrogram_data_and_images(wav_files, mel_spectrograms):
-    """保存梅尔频谱图数据和图像"""
+def resample_waveform(waveform, sample_rate):
+    """重采样到指定的 SR"""
+    if sample_rate != SR:
+        start = time.perf_counter()
+        waveform = get_resampler(sample_rate, SR)(waveform.to(device))
+        resample_stats['seconds'] += time.perf_counter() - start
+        resample_stats['waveforms'] += 1
+    return waveform
+
+def padded_mel_batch(rows):
+    """把已做过反射填充的若干行补零到同一长度，一次计算梅尔频谱（dB）"""
+    batch = torch.zeros(len(rows), max(row.shape[-1] for row in rows), device=device)
+    for i, row in enumerate(rows):
+        batch[i, :row.shape[-1]] = row
+    return amplitude_to_db(mel_spectrogram_transform_uncentered(batch)).cpu().numpy()
+
+@torch.inference_mode()
+def generate_mel_spectrograms_batched(waveforms, sample_rates):
+    """批量计算梅尔频谱：各声道作为一行，按 center=True 的方式分别反射填充 N_FFT//2，
+    再补零到同一长度组成 [行数, 采样点] 张量一次完成 STFT；每行只保留 1 + 长度//HOP_LENGTH 帧，
+    这些帧不涉及补零部分，结果与逐条计算一致。单次计算的规模受 MEL_BATCH_SAMPLES 限制。
+    返回与 generate_mel_spectrograms 相同的列表"""
+    pad = N_FFT // 2
+    rows, frame_counts, channel_counts = [], [], []
+    for waveform, sample_rate in zip(waveforms, sample_rates):
+        waveform = resample_waveform(waveform, sample_rate).to(device)
+        # 反射填充要求有批次维，[声道, 1, 采样点]
+        rows.extend(F.pad(waveform.unsqueeze(1), (pad, pad), mode='reflect').squeeze(1))
+        frame_counts.extend([1 + waveform.shape[-1] // HOP_LENGTH] * waveform.shape[0])
+        channel_counts.append(waveform.shape[0])
+
+    # 按预算把相邻的行分组计算（分桶后相邻片段长度接近）
+    row_mels = []
+    start = 0
+    while start < len(rows):
+        stop, longest = start, 0
+        while stop < len(rows) and (stop == start or (stop - start + 1) * max(longest, rows[stop].shape[-1]) <= MEL_BATCH_SAMPLES):
+            longest = max(longest, rows[stop].shape[-1])
+            stop += 1
+        mel_batch = padded_mel_batch(rows[start:stop])
+        row_mels.extend(mel_batch[i, :, :frame_counts[start + i]] for i in range(stop - start))
+        start = stop
+
+    mel_spectrograms = []
+    row = 0
+    for channels in channel_counts:
+        mel_spectrograms.append(np.stack(row_mels[row:row + channels]))
+        row += channels
+    return mel_spectrograms
+
+def audio_duration(wav_file):
+    """读取文件头得到时长（秒），不解码音频"""
+    info = torchaudio.info(os.path.join(input_folder, wav_file))
+    return info.num_frames / info.sample_rate
+
+def episode_mel_spectrogram(waveform, sample_rate, chunk_frames=EPISODE_MEL_CHUNK_FRAMES):
+    """整集计算梅尔频谱（dB），结果与对整段音频调用 mel_spectrogram_transform 一致。
+    整集只做一次反射填充，再按帧分块计算，相邻块在信号上重叠 N_FFT - HOP_LENGTH 个采样点"""
+    waveform = resample_waveform(waveform, sample_rate).to(device)
+    total_frames = 1 + waveform.shape[-1] // HOP_LENGTH
+    padded = F.pad(waveform.unsqueeze(1), (N_FFT // 2, N_FFT // 2), mode='reflect').squeeze(1)
+    mel_spectrogram = np.empty((waveform.shape[0], N_MELS, total_frames), dtype=np.float32)
+    with torch.inference_mode():
+        for first in range(0, total_frames, chunk_frames):
+            last = min(first + chunk_frames, total_frames)
+            segment = padded[:, first * HOP_LENGTH:(last - 1) * HOP_LENGTH + N_FFT]
+            mel_spectrogram[:, :, first:last] = amplitude_to_db(mel_spectrogram_transform_uncentered(segment)).cpu().numpy()
+    return mel_spectrogram
+
+def line_spectrogram(mel_spectrogram, start_seconds, end_seconds, context_seconds=0):
+    """按字幕起止时间切出频谱，返回视图而非拷贝；帧数与单独计算同一时间段的片段一致（1 + 采样点数//HOP_LENGTH），
+    context_seconds 大于 0 时向两侧各扩展该秒数（在整集范围内截断）"""
+    total_frames = mel_spectrogram.shape[-1]
+    start_sample = round((start_seconds - context_seconds) * SR)
+    end_sample = round((end_seconds + context_seconds) * SR)
+    first = min(max(round(start_sample / HOP_LENGTH), 0), total_frames)
+    last = min(first + 1 + max(end_sample - max(start_sample, 0), 0) // HOP_LENGTH, total_frames)
+    return mel_spectrogram[..., first:last]
+
+def load_line_spectrogram(episode_name, start_seconds, end_seconds, context_seconds=0):
+    """从已保存的整集频谱中按时间取出一段，整集文件以内存映射方式打开，不读入整集"""
+    mel_spectrogram = np.load(os.path.join(episode_npy_output_folder, f'{episode_name}.npy'), mmap_mode='r')
+    return line_spectrogram(mel_spectrogram, start_seconds, end_seconds, context_seconds)
+
+# 整集计算梅尔频谱并切出每条字幕的频谱
+def process_episode_audio_files(render_pool=None):
+    """整集模式：每集加载一次音频、计算一次梅尔频谱，按 <集名>.segments.json 中的时间保存各条字幕的频谱"""
+    os.makedirs(episode_npy_output_folder, exist_ok=True)
+    if CONTEXT_SECONDS > 0:
+        os.makedirs(context_npy_output_folder, exist_ok=True)
+
+    episode_files = sorted(f for f in os.listdir(episode_input_folder) if f.endswith('.wav'))
+    stage_seconds = {'load': 0.0, 'mel': 0.0, 'save': 0.0}
+    for wav_file in tqdm(episode_files, desc="Episodes"):
+        episode_name = wav_file[:-4]
+        segments_path = os.path.join(episode_segments_folder, f'{episode_name}.segments.json')
+        if not os.path.exists(segments_path):
+            print(f"Skipping {wav_file}, {segments_path} not found.")
+            continue
+        with open(segments_path, 'r', encoding='utf-8') as f:
+            segments = json.load(f)['segments']
+
+        stage_start = time.perf_counter()
+        waveform, sample_rate = load_audio(os.path.join(episode_input_folder, wav_file))
+        stage_seconds['load'] += time.perf_counter() - stage_start
+
+        stage_start = time.perf_counter()
+        mel_spectrogram = episode_mel_spectrogram(waveform, sample_rate)
+        stage_seconds['mel'] += time.perf_counter() - stage_start
+
+        stage_start = time.perf_counter()
+        np.save(os.path.join(episode_npy_output_folder, f'{episode_name}.npy'), mel_spectrogram)
+        line_files = [f'{episode_name}_{j+1:03d}.wav' for j in range(len(segments))]
+        save_spectrogram_data_and_images(line_files, [line_spectrogram(mel_spectrogram, start, end)
+                                                      for start, end in segments], render_pool)
+        if CONTEXT_SECONDS > 0:
+            for line_file, (start, end) in zip(line_files, segments):
+                np.save(os.path.join(context_npy_output_folder, line_file.replace('.wav', '.npy')),
+                        line_spectrogram(mel_spectrogram, start, end, CONTEXT_SECONDS))
+        stage_seconds['save'] += time.perf_counter() - stage_start
+
+    report_stage_seconds(stage_seconds)
+
+def should_render_png(npy_file, render_mode=None):
+    """按渲染方式决定是否为该文件生成图像；抽样按文件名哈希，重复运行时选中的文件不变"""
+    render_mode = render_mode or RENDER_PNG
+    if render_mode == 'all':
+        return True
+    if render_mode == 'sample':
+        return zlib.crc32(npy_file.encode('utf-8')) < PNG_SAMPLE_RATE * 2 ** 32
+    return False
+
+def spectrogram_location(npy_file):
+    """打包存储中的 (分片, 键)：<集名>_<序号>.npy -> (<集名>, <集名>_<序号>)"""
+    key = npy_file[:-4]
+    return key.rsplit('_', 1)[0], key
+
+def render_spectrogram_png(source, png_output_path):
+    """在渲染进程中读取频谱（.npy 路径或打包存储的引用）并生成频谱图图像"""
+    if isinstance(source, dict):
+        mel_spectrogram = load_spectrogram_reference(source)
+    else:
+        mel_spectrogram = np.load(source, mmap_mode='r')
+    plt.figure(figsize=(10, 4))
+    plt.imshow(mel_spectrogram[0], aspect='auto', origin='lower')
+    plt.colorbar(format='%+2.0f dB')
+    plt.title('Mel-Spectrogram')
+    plt.tight_layout()
+    plt.savefig(png_output_path)
+    plt.close()
+
+def submit_png_render(render_pool, npy_file, render_mode=None):
+    """需要渲染且图像尚不存在时提交到渲染进程池，立即返回"""
+    png_output_path = os.path.join(png_output_folder, npy_file.replace('.npy', '.png'))
+    if render_pool is None or not should_render_png(npy_file, render_mode) or os.path.exists(png_output_path):
+        return None
+    if spectrogram_store is not None:
+        source = spectrogram_store.reference(*spectrogram_location(npy_file))
+    else:
+        source = os.path.join(npy_output_folder, npy_file)
+    future = render_pool.submit(render_spectrogram_png, source, png_output_path)
+    future.add_done_callback(lambda done: done.exception() and print(f"Error rendering {png_output_path}: {done.exception()}"))
+    return future
+
+# 保存频谱图数据，图像交给渲染进程池
+def save_spectrogram_data_and_images(wav_files, mel_spectrograms, render_pool=None):
+    """保存梅尔频谱图数据，并为需要的文件提交图像渲染"""
     for i, wav_file in enumerate(wav_files):
-        npy_output_path = os.path.join(npy_output_folder, wav_file.replace('.wav', '.npy'))
-        png_output_path = os.path.join(png_output_folder, wav_file.replace('.wav', '.png'))
+        npy_file = wav_file.replace('.wav', '.npy')
+        npy_output_path = os.path.join(npy_output_folder, npy_file)
         
-        # 检查文件是否已经存在
-        if os.path.exists(npy_output_path) and os.path.exists(png_output_path):
+        # 检查文件是否已经存在（图像可以之后单独补画）
+        if spectrogram_store is not None:
+            exists = spectrogram_location(npy_file) in spectrogram_store
+        else:
+            exists = os.path.exists(npy_output_path)
+        if exists:
             print(f"Skipping {wav_file}, files already exist.")
             continue
         
         mel_spectrogram = mel_spectrograms[i]
 
-        # 保存频谱图数据到 .npy 文件
+        # 保存频谱图数据到 .npy 文件，或追加到所在集的打包数据文件
         try:
-            np.save(npy_output_path, mel_spectrogram)
+            if spectrogram_store is not None:
+                spectrogram_store.append(*spectrogram_location(npy_file), mel_spectrogram)
+            else:
+                np.save(npy_output_path, mel_spectrogram)
         except Exception as e:
             print(f"Error saving {npy_output_path}: {e}")
+            continue
         
-        # 生成频谱图图像并保存为 .png 文件
-        plt.figure(figsize=(10, 4))
-        plt.imshow(mel_spectrogram[0], aspect='auto', origin='lower')
-        plt.colorbar(format='%+2.0f dB')
-        plt.title('Mel-Spectrogram')
-        plt.tight_layout()
-        plt.savefig(png_output_path)
-        plt.close()
+        submit_png_render(render_pool, npy_file)
+
+    # 每批写完后提交索引，中断时最多丢失一批
+    if spectrogram_store is not None:
+        spectrogram_store.flush()
+
+def render_missing_pngs(render_mode=None, workers=PNG_WORKERS):
+    """单独的渲染阶段：为已有的 .npy（或打包存储中的频谱）补画缺少的图像"""
+    if spectrogram_store is not None:
+        npy_files = [f'{key}.npy' for shard in spectrogram_store.shards() for key in spectrogram_store.keys(shard)]
+    else:
+        npy_files = sorted(f for f in os.listdir(npy_output_folder) if f.endswith('.npy'))
+    with ProcessPoolExecutor(max_workers=workers) as render_pool:
+        futures = [submit_png_render(render_pool, npy_file, render_mode) for npy_file in npy_files]
+        futures = [future for future in futures if future is not None]
+        for future in tqdm(futures, desc="Rendering"):
+            future.result()
+    print(f"Rendered {len(futures)} spectrogram images.")
 
 # 批处理所有 WAV 文件
-def batch_process_audio_files(audio_files, batch_size):
+def batch_process_audio_files(audio_files, batch_size, render_pool=None):
     """批量处理WAV文件"""
     num_batches = len(audio_files) // batch_size + int(len(audio_files) % batch_size != 0)
 
+    if BATCHED_MEL_ENABLED and BUCKET_BY_LENGTH:
+        audio_files = sorted(audio_files, key=audio_duration)
+
+    stage_seconds = {'load': 0.0, 'mel': 0.0, 'save': 0.0}
     for batch_idx in range(num_batches):
         # 获取当前批次的文件列表
         batch_files = audio_files[batch_idx * batch_size:(batch_idx + 1) * batch_size]
         print(f"Processing batch {batch_idx + 1}/{num_batches}, files: {batch_files}")
         
         # 批量加载音频文件
+        stage_start = time.perf_counter()
         waveforms, sample_rates = batch_load_audio(batch_files, input_folder)
+        stage_seconds['load'] += time.perf_counter() - stage_start
         
         # 生成批量梅尔频谱图
-        mel_spectrograms = generate_mel_spectrograms(waveforms, sample_rates)
+        stage_start = time.perf_counter()
+        if BATCHED_MEL_ENABLED:
+            mel_spectrograms = generate_mel_spectrograms_batched(waveforms, sample_rates)
+        else:
+            mel_spectrograms = generate_mel_spectrograms(waveforms, sample_rates)
+        stage_seconds['mel'] += time.perf_counter() - stage_start
         
         # 保存频谱图数据和图像
-        save_spectrogram_data_and_images(batch_files, mel_spectrograms)
+        stage_start = time.perf_counter()
+        save_spectrogram_data_and_images(batch_files, mel_spectrograms, render_pool)
+        stage_seconds['save'] += time.perf_counter() - stage_start
+
+    report_stage_seconds(stage_seconds)
+
+def main():
+    if '--render-png' in sys.argv:
+        # 只为已有的 .npy 补画图像，传入 --all 时不抽样
+        render_missing_pngs('all' if '--all' in sys.argv else 'sample')
+        return
 
-# 处理所有 WAV 文件
-audio_files = [f for f in os.listdir(input_folder) if f.endswith('.wav')]
+    # 渲染进程池与频谱计算并行，退出时等待剩余图像渲染完成
+    render_pool = ProcessPoolExecutor(max_workers=PNG_WORKERS) if RENDER_PNG != 'none' else None
+    try:
+        if EPISODE_MEL_ENABLED:
+            # 整集计算后按字幕时间切片
+            process_episode_audio_files(render_pool)
+        else:
+            # 处理所有 WAV 文件
+            audio_files = [f for f in os.listdir(input_folder) if f.endswith('.wav')]
 
-print(f"Processing {len(audio_files)} audio files in batches of {BATCH_SIZE}...")
+            print(f"Processing {len(audio_files)} audio files in batches of {BATCH_SIZE}...")
 
-# 批量处理音频文件
-batch_process_audio_files(audio_files, BATCH_SIZE)
+            # 批量处理音频文件
+            batch_process_audio_files(audio_files, BATCH_SIZE, render_pool)
+        if render_pool is not None:
+            print("Spectrograms saved in .npy format, waiting for image rendering...")
+    finally:
+        if render_pool is not None:
+            render_pool.shutdown(wait=True)
 
-print("Processing complete. Spectrograms saved in .npy and .png format.")
+    print("Processing complete. Spectrograms saved in .npy and .png format.")
 
+if __name__ == '__main__':
+    main()
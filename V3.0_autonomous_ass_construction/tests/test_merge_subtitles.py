@@ -0,0 +1,162 @@
+import os
+import sys
+import glob
+import json
+import random
+
+import pytest
+
+# 提取模块导入时不创建PaddleOCR实例，这里只需要 OpenCV
+pytest.importorskip("cv2")
+
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'model_scheduling'))
+from gpu_paddleocr_opencv import (merge_subtitles, generate_ass, similar, is_subset, partial_overlap,
+                                  SIMILARITY_THRESHOLD, PARTIAL_OVERLAP_THRESHOLD)
+
+# 提取时写下的 <名称>.checkpoint.json 与同名 .ass，重新由检查点中的原始元组生成ASS，应与当时的输出逐字节一致。
+# synthetic_clip 由 extract_subtitles 处理一段合成视频得到；在真实剧集上提取后可把同样的一对文件放进来
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+CAPTURED_EPISODES = sorted(os.path.basename(path)[:-len('.checkpoint.json')]
+                           for path in glob.glob(os.path.join(DATA_DIR, '*.checkpoint.json')))
+
+# 手写的原始元组 (开始时间, 结束时间, 文本)：密集采样时同一条字幕的开始时间相同，
+# 含OCR错字、识别不全的半句和相隔较远的重复文本
+SUBTITLE_TUPLES = [
+    (0.0, 0.1, '今天天气真好'),
+    (0.0, 0.2, '今天天气真好'),
+    (0.0, 0.3, '今天天气真好啊'),
+    (0.0, 0.4, '今天天汽真好啊'),
+    (1.2, 1.3, '我们去公园吧'),
+    (1.2, 1.4, '我们去公园'),
+    (1.2, 1.5, '我们去公园吧'),
+    (2.3, 2.4, '好'),
+    (2.3, 2.5, '好的'),
+    (3.5, 3.6, '等一下我拿伞'),
+    (3.5, 3.7, '等一下我拿伞'),
+    (4.4, 4.5, '等一下我拿个伞'),
+    (5.6, 5.7, '外面下雨了吗'),
+    (6.8, 6.9, '没有只是阴天'),
+    (6.8, 7.0, '没有只是阴天'),
+]
+
+MERGED_SUBTITLES = [
+    (0.0, 0.4, '今天天气真好啊'),
+    (1.2, 1.5, '我们去公园吧'),
+    (2.3, 2.5, '好的'),
+    (3.5, 4.5, '等一下我拿个伞'),
+    (5.6, 5.7, '外面下雨了吗'),
+    (6.8, 7.0, '没有只是阴天'),
+]
+
+
+def merge_subtitles_reference(subtitles):
+    """原始的逐条合并逻辑，作为 merge_subtitles 的参照"""
+    merged = []
+    previous_text = None
+    previous_start_time = None
+    previous_end_time = None
+
+    for start_time, end_time, text in subtitles:
+        # 检查时间间隔是否小于 00:00:00.45
+        time_difference = start_time - previous_end_time if previous_end_time is not None else None
+
+        # 检查相似度或子集匹配，或时间间隔小于 00:00:00.45
+        if previous_text and (
+            similar(previous_text, text) > SIMILARITY_THRESHOLD or
+            is_subset(previous_text, text) or
+            (time_difference is not None and time_difference < 0.45)
+        ):
+            previous_end_time = end_time
+            # 保留最长的文本
+            if len(text) > len(previous_text):
+                previous_text = text
+
+        # 补集判断逻辑
+        else:
+            overlap_ratio, non_overlap_len = partial_overlap(previous_text, text)
+            if PARTIAL_OVERLAP_THRESHOLD <= overlap_ratio <= SIMILARITY_THRESHOLD and non_overlap_len < 5:
+                previous_end_time = end_time
+                if len(text) > len(previous_text):
+                    previous_text = text
+            else:
+                # 如果有前一个字幕，先将其输出
+                if previous_text is not None:
+                    merged.append((previous_start_time, previous_end_time, previous_text))
+
+                # 更新为当前字幕
+                previous_text = text
+                previous_start_time = start_time
+                previous_end_time = end_time
+
+    # 输出最后一条字幕
+    if previous_text is not None:
+        merged.append((previous_start_time, previous_end_time, previous_text))
+    return merged
+
+
+def load_captured_subtitles(name):
+    with open(os.path.join(DATA_DIR, f'{name}.checkpoint.json'), 'r', encoding='utf-8') as f:
+        return [tuple(subtitle) for subtitle in json.load(f)['tracker']['subtitles']]
+
+
+def merge_outcome(merge, subtitles):
+    """合并结果；原始逻辑在空文本等情况下会抛异常，此时比较异常类型"""
+    try:
+        return merge(subtitles)
+    except Exception as error:
+        return type(error)
+
+
+def random_subtitles(rng, alphabet, max_count, empty_rate):
+    subtitles = []
+    end_time = 0.0
+    base = ''.join(rng.choice(alphabet) for _ in range(rng.randint(1, 12)))
+    for _ in range(rng.randint(0, max_count)):
+        if rng.random() < 0.15:
+            base = ''.join(rng.choice(alphabet) for _ in range(rng.randint(1, 12)))
+        if rng.random() < empty_rate:
+            text = ''
+        elif rng.random() < 0.7:
+            text = base
+        else:
+            text = base[:rng.randint(1, len(base))] + rng.choice(alphabet)
+        start_time = round(end_time + rng.choice([-0.2, 0.0, 0.0, 0.3, 0.6, 1.0]), 2)
+        end_time = round(start_time + rng.choice([0.1, 0.2, 0.5]), 2)
+        subtitles.append((start_time, end_time, text))
+    return subtitles
+
+
+def test_reference_on_fixture_tuples():
+    assert merge_subtitles_reference(SUBTITLE_TUPLES) == MERGED_SUBTITLES
+
+
+def test_merge_matches_reference_on_fixture_tuples():
+    assert merge_subtitles(SUBTITLE_TUPLES) == MERGED_SUBTITLES
+
+
+@pytest.mark.parametrize("name", CAPTURED_EPISODES)
+def test_generate_ass_matches_captured_output(name, tmp_path):
+    output_path = tmp_path / f'{name}.ass'
+    generate_ass(load_captured_subtitles(name), output_path)
+    with open(os.path.join(DATA_DIR, f'{name}.ass'), 'rb') as f:
+        # generate_ass 以文本模式写入，换行符随平台而定
+        expected = f.read().replace(b'\r\n', b'\n').replace(b'\n', os.linesep.encode())
+    assert output_path.read_bytes() == expected
+
+
+@pytest.mark.parametrize("name", CAPTURED_EPISODES)
+def test_merge_matches_reference_on_captured_tuples(name):
+    subtitles = load_captured_subtitles(name)
+    assert merge_subtitles(subtitles) == merge_subtitles_reference(subtitles)
+
+
+@pytest.mark.parametrize("alphabet, max_count, empty_rate", [
+    ('你我他她它的了是在有不这人们中来上大为和国地到以说时要就出会可也', 200, 0.0),
+    ('你我他的了是在', 12, 0.15),
+])
+def test_merge_matches_reference_on_random_tuples(alphabet, max_count, empty_rate):
+    rng = random.Random(0)
+    for _ in range(500):
+        subtitles = random_subtitles(rng, alphabet, max_count, empty_rate)
+        assert merge_outcome(merge_subtitles, subtitles) == merge_outcome(merge_subtitles_reference, subtitles), subtitles
+
@@ -1 +1,308 @@
-#优化时再考虑
\ No newline at end of file
+#优化时再考虑
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+
+def to_json_compatible(value):
+    """把 NumPy 数组/标量等转换为可 JSON 序列化的 Python 类型"""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"无法序列化的类型: {type(value)}")
+
+
+class DiskLRUCache:
+    """基于 SQLite 的磁盘缓存：值以 JSON 存储，总大小超过上限时按最近访问时间淘汰。
+
+    可在多个线程间共享，所有读写都在同一把锁内完成。总大小在打开时统计一次，之后随写入和淘汰
+    在内存中增减，只有超过上限需要淘汰时才扫描表；同一缓存文件只应由一个进程写入。
+    """
+
+    def __init__(self, path, max_bytes):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, accessed REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+        self.connection.commit()
+        self.total_bytes = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys):
+        """批量查询，返回 {键: 值}，未命中的键不出现在结果中"""
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self.lock:
+            # SQLite 单条语句的参数数量有限，分段查询
+            for i in range(0, len(unique_keys), 500):
+                chunk = unique_keys[i:i + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self.connection.execute(
+                    f"SELECT key, value FROM cache WHERE key IN ({placeholders})", chunk).fetchall()
+                found.update((key, json.loads(value)) for key, value in rows)
+            if found:
+                now = time.time()
+                self.connection.executemany("UPDATE cache SET accessed = ? WHERE key = ?",
+                                            [(now, key) for key in found])
+                self.connection.commit()
+            self.hits += len(found)
+            self.misses += len(unique_keys) - len(found)
+        return found
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items):
+        """批量写入 {键: 值}，写入后按需淘汰最久未访问的条目"""
+        now = time.time()
+        rows = []
+        for key, value in items.items():
+            encoded = json.dumps(value, ensure_ascii=False, default=to_json_compatible)
+            rows.append((key, encoded, len(encoded.encode('utf-8')), now))
+        if not rows:
+            return
+        with self.lock:
+            # 被覆盖的键先减去旧大小（按主键查，不扫全表）
+            for i in range(0, len(rows), 500):
+                chunk = [row[0] for row in rows[i:i + 500]]
+                placeholders = ','.join('?' * len(chunk))
+                self.total_bytes -= self.connection.execute(
+                    f"SELECT COALESCE(SUM(size), 0) FROM cache WHERE key IN ({placeholders})", chunk).fetchone()[0]
+            self.connection.executemany("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)", rows)
+            self.total_bytes += sum(row[2] for row in rows)
+            self.evict()
+            self.connection.commit()
+
+    def put(self, key, value):
+        self.put_many({key: value})
+
+    def evict(self):
+        """总大小超过上限时，删除最久未访问的条目，直到回落到上限的 90%"""
+        if self.total_bytes <= self.max_bytes:
+            return
+        target = self.max_bytes * 0.9
+        for key, size in self.connection.execute("SELECT key, size FROM cache ORDER BY accessed").fetchall():
+            if self.total_bytes <= target:
+                break
+            self.connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self.total_bytes -= size
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class SpectrogramStore:
+    """按分片（通常每集一个）打包存放的频谱：每个分片一个连续的数据文件 <分片>.bin，
+    加一个索引 <分片>.index.json，记录每段频谱的键、元素偏移与形状。
+
+    读取时用 np.memmap 映射整个分片，按键取出的是零拷贝视图。写入只在数据文件末尾追加，
+    索引在 flush 时原子替换；未写入索引的尾部数据（如中途崩溃）会在下次追加前截掉。
+    同一个键再次写入时索引指向新数据，旧数据留在文件中不再被引用。
+    """
+
+    def __init__(self, root, dtype='float16'):
+        self.root = root
+        self.dtype = np.dtype(dtype)
+        self.indexes = {}  # 分片 -> {'dtype': ..., 'entries': {键: [偏移, 形状]}}
+        self.dirty = set()
+        self.memmaps = {}
+        os.makedirs(root, exist_ok=True)
+
+    def data_path(self, shard):
+        return os.path.join(self.root, f'{shard}.bin')
+
+    def index_path(self, shard):
+        return os.path.join(self.root, f'{shard}.index.json')
+
+    def shards(self):
+        suffix = '.index.json'
+        return sorted(f[:-len(suffix)] for f in os.listdir(self.root) if f.endswith(suffix))
+
+    def index(self, shard):
+        if shard not in self.indexes:
+            path = self.index_path(shard)
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.indexes[shard] = json.load(f)
+            else:
+                self.indexes[shard] = {'dtype': self.dtype.str, 'entries': {}}
+        return self.indexes[shard]
+
+    def keys(self, shard):
+        return list(self.index(shard)['entries'])
+
+    def __contains__(self, location):
+        shard, key = location
+        return key in self.index(shard)['entries']
+
+    def end(self, shard):
+        """索引覆盖到的数据末尾（元素个数）"""
+        entries = self.index(shard)['entries']
+        return max((offset + int(np.prod(shape)) for offset, shape in entries.values()), default=0)
+
+    def append(self, shard, key, array):
+        """把一段频谱追加到分片末尾，返回其元素偏移"""
+        index = self.index(shard)
+        dtype = np.dtype(index['dtype'])
+        end = self.end(shard)
+        self.memmaps.pop(shard, None)
+        with open(self.data_path(shard), 'ab') as f:
+            if f.tell() != end * dtype.itemsize:
+                f.truncate(end * dtype.itemsize)
+                f.seek(end * dtype.itemsize)
+            np.ascontiguousarray(array, dtype=dtype).tofile(f)
+        index['entries'][key] = [end, list(np.shape(array))]
+        self.dirty.add(shard)
+        return end
+
+    def flush(self):
+        """原子地写入有变化的分片索引"""
+        for shard in list(self.dirty):
+            path = self.index_path(shard)
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(self.indexes[shard], f)
+            os.replace(path + '.tmp', path)
+            self.dirty.discard(shard)
+
+    def memmap(self, shard):
+        if shard not in self.memmaps:
+            dtype = np.dtype(self.index(shard)['dtype'])
+            # 只映射索引覆盖的部分，忽略未提交的尾部数据
+            self.memmaps[shard] = np.memmap(self.data_path(shard), dtype=dtype, mode='r', shape=(self.end(shard),))
+        return self.memmaps[shard]
+
+    def get(self, shard, key):
+        """按键取出频谱，返回映射到数据文件的只读视图"""
+        offset, shape = self.index(shard)['entries'][key]
+        return self.memmap(shard)[offset:offset + int(np.prod(shape))].reshape(shape)
+
+    def items(self, shard):
+        for key in self.keys(shard):
+            yield key, self.get(shard, key)
+
+    def reference(self, shard, key):
+        """可写入 JSON 的引用：数据文件、元素偏移、形状与数据类型"""
+        offset, shape = self.index(shard)['entries'][key]
+        return {'shard': self.data_path(shard), 'key': key, 'offset': offset, 'shape': shape,
+                'dtype': self.index(shard)['dtype']}
+
+
+def load_spectrogram_reference(reference):
+    """按 SpectrogramStore.reference 生成的引用读取频谱（零拷贝视图）"""
+    count = int(np.prod(reference['shape']))
+    data = np.memmap(reference['shard'], dtype=np.dtype(reference['dtype']), mode='r',
+                     offset=reference['offset'] * np.dtype(reference['dtype']).itemsize, shape=(count,))
+    return data.reshape(reference['shape'])
+
+
+def pooled_spectrogram_features(spectrogram, feature_mode='band_stats', n_mfcc=20):
+    """把 [声道, 梅尔频带, 帧] 的分贝频谱池化为与时长无关的定长特征向量；没有帧时返回 None
+
+    'band_stats' 为每个梅尔频带在时间上的均值与标准差，'mfcc_stats' 为前 n_mfcc 个倒谱系数的均值与标准差。
+    """
+    spectrogram = np.asarray(spectrogram, dtype=np.float32)
+    spectrogram = spectrogram.reshape(-1, spectrogram.shape[-2], spectrogram.shape[-1]).mean(axis=0)
+    if spectrogram.shape[-1] == 0:
+        return None
+    if feature_mode == 'mfcc_stats':
+        from scipy.fft import dct
+        spectrogram = dct(spectrogram, type=2, axis=0, norm='ortho')[:n_mfcc]
+    return np.concatenate([spectrogram.mean(axis=1), spectrogram.std(axis=1)])
+
+
+class NearestCentroidModel:
+    """最近质心模型：聚类质心、特征标准化参数与对外使用的类别编号，用于批量为新片段分配角色类别。
+
+    质心位于标准化后的特征空间；label_ids[i] 是第 i 个质心的类别编号。重新聚类后用 match_labels
+    与上一版模型逐一对齐质心，使同一角色的编号在多次运行之间保持不变。
+    """
+
+    def __init__(self, centroids, mean, scale, label_ids=None, feature_mode='band_stats', n_mfcc=20):
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.scale = np.asarray(scale, dtype=np.float32)
+        self.label_ids = np.arange(len(self.centroids)) if label_ids is None else np.asarray(label_ids)
+        self.feature_mode = feature_mode
+        self.n_mfcc = n_mfcc
+
+    def features(self, spectrogram):
+        return pooled_spectrogram_features(spectrogram, self.feature_mode, self.n_mfcc)
+
+    def normalize(self, features):
+        return (np.asarray(features, dtype=np.float32) - self.mean) / self.scale
+
+    def distances(self, features):
+        """[片段数, 质心数] 的平方欧氏距离，一次矩阵乘法算出"""
+        x = self.normalize(np.atleast_2d(features))
+        distances = (x * x).sum(axis=1, keepdims=True) - 2 * x @ self.centroids.T + (self.centroids ** 2).sum(axis=1)
+        return np.maximum(distances, 0)
+
+    def assign(self, features):
+        """为 [片段数, 特征维数] 的特征批量分配最近质心的类别编号"""
+        return self.label_ids[self.distances(features).argmin(axis=1)]
+
+    def match_labels(self, previous):
+        """按质心距离与上一版模型做一一匹配（匈牙利算法），沿用对应的编号；多出的质心使用新编号"""
+        from scipy.optimize import linear_sum_assignment
+        # 在上一版模型的特征空间中比较，标准化参数变化时也可比
+        centroids = previous.normalize(self.centroids * self.scale + self.mean)
+        cost = ((centroids[:, None, :] - previous.centroids[None, :, :]) ** 2).sum(axis=2)
+        rows, cols = linear_sum_assignment(cost)
+        label_ids = np.full(len(self.centroids), -1)
+        label_ids[rows] = previous.label_ids[cols]
+        unmatched = np.flatnonzero(label_ids < 0)
+        next_id = int(previous.label_ids.max()) + 1 if len(previous.label_ids) else 0
+        label_ids[unmatched] = np.arange(next_id, next_id + len(unmatched))
+        self.label_ids = label_ids
+
+    def save(self, path):
+        """先写临时文件再替换，读取方不会看到写了一半的模型"""
+        with open(path + '.tmp', 'wb') as f:
+            np.savez(f, centroids=self.centroids, mean=self.mean, scale=self.scale, label_ids=self.label_ids,
+                     feature_mode=np.array(self.feature_mode), n_mfcc=np.array(self.n_mfcc))
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['centroids'], data['mean'], data['scale'], data['label_ids'],
+                       str(data['feature_mode']), int(data['n_mfcc']))
+
+
+def fill_characters(data, keys, model_path, spectrogram_folder, spectrogram_store_folder):
+    """用最近质心模型为 JSON 项填写 character：keys[i] 是 data[i] 对应的频谱键（<集名>_<序号>），
+    频谱优先从打包存储读取，否则读取 <键>.npy；所有项的特征汇总后一次性分配。返回填写的项数
+    """
+    if not os.path.exists(model_path):
+        return 0
+    model = NearestCentroidModel.load(model_path)
+    store = SpectrogramStore(spectrogram_store_folder) if os.path.isdir(spectrogram_store_folder) else None
+    indices, features = [], []
+    for i, key in enumerate(keys):
+        shard = key.rsplit('_', 1)[0]
+        npy_path = os.path.join(spectrogram_folder, f'{key}.npy')
+        if store is not None and (shard, key) in store:
+            feature = model.features(store.get(shard, key))
+        elif os.path.exists(npy_path):
+            feature = model.features(np.load(npy_path, mmap_mode='r'))
+        else:
+            continue
+        if feature is not None:
+            indices.append(i)
+            features.append(feature)
+    if features:
+        for i, label in zip(indices, model.assign(np.stack(features))):
+            data[i]["character"] = int(label)
+    return len(indices)